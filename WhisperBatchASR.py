@@ -4,9 +4,11 @@ import json
 import torch
 from transformers import AutoProcessor, AutoModelForSpeechSeq2Seq, pipeline
 from tqdm import tqdm
+from manifest import list_files
 
 '''
 python WhisperBatchASR.py -i wav/noisy -o wav/noisy/noisy_text.json
+python WhisperBatchASR.py -i wav/noisy -o wav/noisy/noisy_text.json --manifest wav_manifest.tsv
 '''
 
 class WhisperASR():
@@ -44,7 +46,7 @@ def main(args):
     asr_model = WhisperASR()
     results = {}
 
-    wav_files = sorted([f for f in os.listdir(input_dir) if f.lower().endswith(".wav")])
+    wav_files = [os.path.relpath(p, input_dir) for p in list_files(input_dir, args.manifest)]
 
     print(f"Found {len(wav_files)} wav files.")
 
@@ -73,5 +75,6 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('-i','--input_wav_dir', default='wav/clean')
     parser.add_argument('-o', '--output_test_json', default='wav/clean/clean_text.json')
+    parser.add_argument('--manifest', nargs='+', default=None, help='Manifest(s) from manifest.py to look the wav files up in instead of listing the folder')
     args = parser.parse_args()
     main(args)
@@ -0,0 +1,78 @@
+import numpy as np
+
+'''
+SI-SNR / SI-SDR in NumPy, for one pair or for a zero-padded (B, T) batch with per-row lengths:
+from batch_si_sdr import si_sdr, batch_si_sdr, pad_batch
+est, lengths = pad_batch(enhanced_signals)
+ref, _ = pad_batch(clean_signals)
+si_snr = batch_si_sdr(est, ref, lengths, zero_mean=True)    # (B,) dB
+
+parity with torchmetrics (if installed) and with the per-pair function:
+python batch_si_sdr.py
+'''
+
+
+def si_sdr(est, ref, zero_mean=False):
+    """Same as torchmetrics scale_invariant_signal_distortion_ratio, SI-SNR with zero_mean=True"""
+    eps = np.finfo(est.dtype).eps
+    if zero_mean:
+        est = est - est.mean()
+        ref = ref - ref.mean()
+    alpha = (np.dot(est, ref) + eps) / (np.dot(ref, ref) + eps)
+    target = alpha * ref
+    noise = target - est
+    return 10 * np.log10((np.dot(target, target) + eps) / (np.dot(noise, noise) + eps))
+
+
+def pad_batch(signals, dtype=np.float64):
+    """list of (L_i,) arrays -> zero-padded (B, max L_i) array and the lengths (B,)"""
+    lengths = np.array([len(s) for s in signals])
+    batch = np.zeros((len(signals), lengths.max(initial=0)), dtype=dtype)
+    for i, s in enumerate(signals):
+        batch[i, :len(s)] = s
+    return batch, lengths
+
+
+def batch_si_sdr(est, ref, lengths=None, zero_mean=False):
+    """
+    est, ref: (B, T) zero-padded, lengths: (B,) valid samples per row (default: all T)
+    returns: (B,) SI-SDR in dB of each row's first lengths[i] samples, si_sdr row by row
+    """
+    eps = np.finfo(est.dtype).eps
+    if lengths is not None and np.any(lengths < est.shape[1]):
+        mask = np.arange(est.shape[1]) < np.asarray(lengths)[:, None]
+        est, ref = est * mask, ref * mask
+    else:
+        mask, lengths = None, np.full(est.shape[0], est.shape[1])
+    if zero_mean:
+        est = est - est.sum(1, keepdims=True) / lengths[:, None]
+        ref = ref - ref.sum(1, keepdims=True) / lengths[:, None]
+        if mask is not None:
+            est, ref = est * mask, ref * mask
+    ref_energy = np.einsum('bt,bt->b', ref, ref)
+    alpha = (np.einsum('bt,bt->b', est, ref) + eps) / (ref_energy + eps)
+    noise = alpha[:, None] * ref - est
+    return 10 * np.log10((alpha ** 2 * ref_energy + eps) / (np.einsum('bt,bt->b', noise, noise) + eps))
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    lengths = rng.integers(1000, 48000, size=32)
+    refs = [rng.standard_normal(n) for n in lengths]
+    ests = [r + rng.uniform(0.01, 3) * rng.standard_normal(len(r)) + rng.uniform(-1, 1) for r in refs]
+    est, _ = pad_batch(ests)
+    ref, _ = pad_batch(refs)
+
+    for zero_mean, name in [(True, 'SI-SNR'), (False, 'SI-SDR')]:
+        batched = batch_si_sdr(est, ref, lengths, zero_mean)
+        per_pair = np.array([si_sdr(e, r, zero_mean) for e, r in zip(ests, refs)])
+        print(f"{name} batched vs per-pair max error: {np.abs(batched - per_pair).max():.2e} dB")
+        try:
+            import torch
+            from torchmetrics.functional.audio import scale_invariant_signal_distortion_ratio
+        except ImportError:
+            print("torchmetrics not installed, skipping the torchmetrics parity check")
+            continue
+        reference = np.array([scale_invariant_signal_distortion_ratio(torch.from_numpy(e), torch.from_numpy(r), zero_mean).item()
+                              for e, r in zip(ests, refs)])
+        print(f"{name} batched vs torchmetrics max error: {np.abs(batched - reference).max():.2e} dB")
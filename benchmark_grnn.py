@@ -0,0 +1,53 @@
+import time
+import argparse
+import torch
+from gtcrn import GRNN, FusedGRNN
+
+'''
+CPU micro-benchmark of GRNN (chunk + 2 GRUs + cat) against FusedGRNN (one block-diagonal GRU)
+in the two DPGRNN configurations: intra (bidirectional over the 33 ERB bands, batch B*T)
+and inter (unidirectional over T frames, batch B*33).
+
+python benchmark_grnn.py
+python benchmark_grnn.py --seq_lengths 1 63 250 1000 --num_threads 4
+'''
+
+def timeit(fn, repeats):
+    with torch.no_grad():
+        fn()  # warm up
+        tic = time.perf_counter()
+        for _ in range(repeats):
+            fn()
+    return (time.perf_counter() - tic) / repeats * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare GRNN and FusedGRNN on CPU")
+    parser.add_argument("--seq_lengths", type=int, nargs='+', default=[1, 16, 63, 250, 1000], help="Number of STFT frames T")
+    parser.add_argument("--batch_size", type=int, default=1, help="Utterances per batch B")
+    parser.add_argument("--num_threads", type=int, default=1, help="torch intra-op threads (default: 1)")
+    parser.add_argument("--repeats", type=int, default=20, help="Timed runs per configuration")
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.num_threads)
+    width, channels = 33, 16
+    configs = {
+        'intra': GRNN(channels, channels // 2, bidirectional=True).eval(),
+        'inter': GRNN(channels, channels, bidirectional=False).eval(),
+    }
+
+    print(f"{'rnn':6s}{'T':>6s}{'GRNN(ms)':>12s}{'Fused(ms)':>12s}{'speedup':>10s}{'max err':>12s}")
+    for name, grnn in configs.items():
+        fused = FusedGRNN(grnn).eval()
+        for T in args.seq_lengths:
+            if name == 'intra':
+                x = torch.randn(args.batch_size * T, width, channels)
+            else:
+                x = torch.randn(args.batch_size * width, T, channels)
+            t_grnn = timeit(lambda: grnn(x), args.repeats)
+            t_fused = timeit(lambda: fused(x), args.repeats)
+            with torch.no_grad():
+                err = (grnn(x)[0] - fused(x)[0]).abs().max().item()
+            print(f"{name:6s}{T:6d}{t_grnn:12.3f}{t_fused:12.3f}{t_grnn / t_fused:9.2f}x{err:12.2e}")
+
+if __name__ == "__main__":
+    main()
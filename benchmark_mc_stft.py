@@ -0,0 +1,47 @@
+import argparse
+import torch
+from mc_stft import STFT, multi_channeled_STFT
+from benchmark_grnn import timeit
+
+'''
+CPU benchmark of multi_channeled_STFT (one [B*C, T] STFT/iSTFT call) against the former
+per-channel loop (one call per channel + torch.stack), for 2 to 32 channels.
+
+python benchmark_mc_stft.py
+python benchmark_mc_stft.py --channels 2 4 8 16 32 --batch_size 4 --seconds 4 --num_threads 4
+'''
+
+def loop_stft(stft, wav):
+    return torch.stack([stft.to_spec_complex(wav[:, ch]) for ch in range(wav.shape[1])], dim=1)
+
+def loop_istft(stft, spec):
+    return torch.stack([stft.restore_complex(spec[:, ch]) for ch in range(spec.shape[1])], dim=1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the vectorised multi-channel STFT with a per-channel loop on CPU")
+    parser.add_argument("--channels", type=int, nargs='+', default=[2, 4, 8, 16, 32], help="Channel counts C")
+    parser.add_argument("--batch_size", type=int, default=4, help="Batch size B")
+    parser.add_argument("--seconds", type=float, default=4., help="Signal length at 16kHz")
+    parser.add_argument("--n_fft", type=int, default=512)
+    parser.add_argument("--hop_length", type=int, default=128)
+    parser.add_argument("--num_threads", type=int, default=1, help="torch intra-op threads (default: 1)")
+    parser.add_argument("--repeats", type=int, default=20, help="Timed runs per configuration")
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.num_threads)
+    mc_stft = multi_channeled_STFT(args.n_fft, args.hop_length)
+    stft = STFT(args.n_fft, args.hop_length)
+
+    print(f"{'C':>4s}{'op':>7s}{'loop(ms)':>12s}{'batched(ms)':>13s}{'speedup':>10s}{'max err':>12s}")
+    for C in args.channels:
+        wav = torch.randn(args.batch_size, C, int(args.seconds * 16000))
+        spec = mc_stft.to_spec_complex(wav)
+        for op, loop_fn, batched_fn in [('stft', lambda: loop_stft(stft, wav), lambda: mc_stft.to_spec_complex(wav)),
+                                        ('istft', lambda: loop_istft(stft, spec), lambda: mc_stft.restore_complex(spec))]:
+            t_loop = timeit(loop_fn, args.repeats)
+            t_batched = timeit(batched_fn, args.repeats)
+            err = (loop_fn() - batched_fn()).abs().max().item()
+            print(f"{C:4d}{op:>7s}{t_loop:12.3f}{t_batched:13.3f}{t_loop / t_batched:9.2f}x{err:12.2e}")
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,79 @@
 import argparse
 import os
-from scipy.io import wavfile
+from functools import partial
 from pesq import pesq
-from tqdm import tqdm
+from metric_cache import MetricCache, cached_map, package_version, pool_map
+from result_log import ResultLog
+from manifest import list_pairs
+from wav_io import as_float, load_wav
 # from torchmetrics.audio import PerceptualEvaluationSpeechQuality
 # import torch
 '''
 python calculate_PESQ.py --clean_folder wav/clean --enhanced_folder wav/noisy --mode wb
 python calculate_PESQ.py --clean_folder ../VCTK-DEMAND/test/clean/ --enhanced_folder ../VCTK-DEMAND/test/enhanced/
+python calculate_PESQ.py --clean_folder ../VCTK-DEMAND/test/clean/ --enhanced_folder ../VCTK-DEMAND/test/enhanced/ --jobs 8
+python calculate_PESQ.py --clean_folder ../VCTK-DEMAND/test/clean/ --enhanced_folder ../VCTK-DEMAND/test/enhanced/ --cache metric_cache.sqlite
+python calculate_PESQ.py --clean_folder ../VCTK-DEMAND/test/clean/ --enhanced_folder ../VCTK-DEMAND/test/enhanced/ --manifest vctk_test.tsv
+python calculate_PESQ.py --clean_folder ../VCTK-DEMAND/test/clean/ --enhanced_folder ../VCTK-DEMAND/test/enhanced/ -o pesq.jsonl --resume
 '''
 
+def pesq_any_rate(ref, deg, fs, mode):
+    """PESQ of equal-length signals at fs, resampled to 16 kHz when pesq does not take fs for the mode (also used by calculate_metrics.py)"""
+    if fs not in (8000, 16000) or (mode == 'wb' and fs != 16000):
+        from resampler import resample
+        ref, deg, fs = resample(as_float(ref, float), fs, 16000), resample(as_float(deg, float), fs, 16000), 16000
+    return pesq(fs, ref, deg, mode)
+
+def pesq_params(mode):
+    """MetricCache params of PESQ scores, shared with calculate_metrics.py (resample=1: other rates are resampled, not scored as 16 kHz)"""
+    return f"mode={mode};pesq={package_version('pesq')};resample=1"
+
 def calculate_pesq(clean_file, enhanced_file, mode):
-    _, ref = wavfile.read(clean_file)
-    _, deg = wavfile.read(enhanced_file)
+    ref, fs = load_wav(clean_file)
+    deg, fs_deg = load_wav(enhanced_file)
+    if fs != fs_deg:
+        raise ValueError(f"Sampling rates of the two files do not match: {fs} Hz, {fs_deg} Hz")
     m=min(len(ref),len(deg))
-    pesq_score = pesq(16000, ref[:m], deg[:m], mode)
+    pesq_score = pesq_any_rate(ref[:m], deg[:m], fs, mode)
     # wb_pesq = PerceptualEvaluationSpeechQuality(16000, mode)
     # pesq_score=wb_pesq(torch.from_numpy(deg[:m]), torch.from_numpy(ref[:m])).item()
     return pesq_score
 
-def calculate_average_pesq(clean_folder, enhanced_folder, mode):
-    pesq_list = []
-    for clean_file in tqdm(os.listdir(clean_folder), desc='Average PESQ calculating'):
-        if clean_file.endswith('.wav'):
-            clean_path = os.path.join(clean_folder, clean_file)
-            enhanced_path = os.path.join(enhanced_folder, clean_file)
+def score_pair(pair, mode):
+    """(clean_path, enhanced_path) -> (PESQ, None), or (None, error) for a file pesq rejects"""
+    clean_path, enhanced_path = pair
+    try:
+        return calculate_pesq(clean_path, enhanced_path, mode), None
+    except Exception as e:  # e.g. pesq.NoUtterancesError on a silent file
+        return None, f"{type(e).__name__}: {e}"
+
+def score_pairs(pairs, mode, jobs=1, chunk_size=None):
+    """yields (PESQ, error) of each pair in order, as they complete"""
+    return pool_map(partial(score_pair, mode=mode), pairs, jobs, chunk_size, 'Average PESQ calculating')
+
+def calculate_average_pesq(clean_folder, enhanced_folder, mode, jobs=1, chunk_size=None, cache=None, log=None, manifests=None):
+    """per-file PESQ goes to log (a ResultLog) as it completes, pairs already in it are skipped"""
+    log = log or ResultLog(None, ['file', 'pesq'])
+    pairs = [(c, e) for c, e in list_pairs(clean_folder, enhanced_folder, manifests)
+             if os.path.relpath(c, clean_folder) not in log.done]
+    if log.done:
+        print(f"Resuming: {len(log.done)} files already scored, {len(pairs)} to go")
 
-            if not os.path.exists(enhanced_path):
-                print(f"Enhanced file not found for: {clean_path}")
-                continue
+    results = cached_map(cache, 'pesq', pesq_params(mode), pairs,
+                         partial(score_pairs, mode=mode, jobs=jobs, chunk_size=chunk_size))
 
-            pesq_score = calculate_pesq(clean_path, enhanced_path, mode)
-            pesq_list.append(pesq_score)
-            
-            # print(f"File: {clean_file}, PESQ: {pesq_score}")
+    for (clean_path, _), (pesq_score, error) in zip(pairs, results):
+        if error is not None:
+            print(f"PESQ failed for {clean_path}: {error}")
+        log.write({'file': os.path.relpath(clean_path, clean_folder), 'pesq': pesq_score})
+        # print(f"File: {os.path.relpath(clean_path, clean_folder)}, PESQ: {pesq_score}")
 
-    if pesq_list:
-        average_pesq = sum(pesq_list) / len(pesq_list)
+    average_pesq = log.stats.mean('pesq')
+    if average_pesq is not None:
         print("Average PESQ:", mode, average_pesq)
+        failed = log.stats.failed.get('pesq', 0)
+        if failed:
+            print(f"{failed} of {failed + log.stats.count['pesq']} files failed and are left out of the average")
     else:
         print("No PESQ values calculated. Check if the folders contain matching WAV files.")
 
@@ -46,9 +82,21 @@ def main():
     parser.add_argument('--clean_folder', '-c', type=str, required=True, help="Path to the folder containing clean WAV files")
     parser.add_argument('--enhanced_folder', '-e', type=str, required=True, help="Path to the folder containing enhanced WAV files")
     parser.add_argument('--mode', '-m', type=str, choices=['wb', 'nb'], default='wb', help="PESQ mode: 'wb' for wideband or 'nb' for narrowband (default: 'wb')")
+    parser.add_argument('--jobs', '-j', type=int, default=1, help="Worker processes (default: 1, sequential)")
+    parser.add_argument('--chunk_size', type=int, default=None, help="Pairs handed to a worker at a time (default: about 4 chunks per worker)")
+    parser.add_argument('--cache', type=str, default=None, help="SQLite result cache: only new or changed pairs are scored (default: no cache)")
+    parser.add_argument('--cache_size_mb', type=float, default=256, help="Cache size bound, least recently used results evicted first (default: 256)")
+    parser.add_argument('--output', '-o', type=str, default=None, help="Per-file results, appended as they complete (.jsonl, or .csv)")
+    parser.add_argument('--resume', action='store_true', help="Keep the results already in --output and score only the remaining files")
+    parser.add_argument('--manifest', type=str, nargs='+', default=None, help="Manifest(s) from manifest.py to look the files up in instead of listing the folders")
     args = parser.parse_args()
     
-    calculate_average_pesq(args.clean_folder, args.enhanced_folder, args.mode)
+    with ResultLog(args.output, ['file', 'pesq'], resume=args.resume) as log:
+        if args.cache:
+            with MetricCache(args.cache, args.cache_size_mb) as cache:
+                calculate_average_pesq(args.clean_folder, args.enhanced_folder, args.mode, args.jobs, args.chunk_size, cache, log, args.manifest)
+        else:
+            calculate_average_pesq(args.clean_folder, args.enhanced_folder, args.mode, args.jobs, args.chunk_size, log=log, manifests=args.manifest)
 
 if __name__ == "__main__":
     main()
@@ -1,46 +1,48 @@
 import os
 import argparse
-import torch
-from torchmetrics.audio import ScaleInvariantSignalDistortionRatio
-import soundfile as sf
+import numpy as np
 from tqdm import tqdm
+from batch_si_sdr import batch_si_sdr, pad_batch
+from result_log import ResultLog
+from manifest import list_pairs
+from wav_io import read_audio
 
 '''
 python calculate_SI-SDR.py --clean_folder wav/clean --enhanced_folder wav/gtcrn_enh
+python calculate_SI-SDR.py --clean_folder wav/clean --enhanced_folder wav/gtcrn_enh --batch_size 256
+python calculate_SI-SDR.py --clean_folder wav/clean --enhanced_folder wav/noisy -o si_sdr.jsonl --resume
+python calculate_SI-SDR.py --clean_folder wav/clean --enhanced_folder wav/noisy --manifest wav_manifest.tsv
 '''
 
-def calculate_si_sdr(enhanced_file, clean_file):
-    enhanced_signal, _ = sf.read(enhanced_file)
-    clean_signal, _ = sf.read(clean_file)
+def read_pair(enhanced_file, clean_file):
+    enhanced_signal, _ = read_audio(enhanced_file, dtype=np.float64)
+    clean_signal, _ = read_audio(clean_file, dtype=np.float64)
 
     min_length = min(len(clean_signal), len(enhanced_signal))
-    clean_signal = clean_signal[:min_length]
-    enhanced_signal = enhanced_signal[:min_length]
-
-    enhanced_signal_tensor = torch.tensor(enhanced_signal)
-    clean_signal_tensor = torch.tensor(clean_signal)
-    si_sdr = ScaleInvariantSignalDistortionRatio()
-    si_sdr_value = si_sdr(enhanced_signal_tensor, clean_signal_tensor)
-    return si_sdr_value.item()
-
-def calculate_average_si_sdr(clean_folder, enhanced_folder):
-    si_sdr_list = []
-    for clean_file in tqdm(os.listdir(clean_folder), desc='Average SI-SDR calculating'):
-        if clean_file.endswith('.wav'):
-            clean_path = os.path.join(clean_folder, clean_file)
-            enhanced_path = os.path.join(enhanced_folder, clean_file)
-
-            if not os.path.exists(enhanced_path):
-                print(f"Enhanced file not found for: {clean_path}")
-                continue
-
-            si_sdr_value = calculate_si_sdr(enhanced_path, clean_path)
-            si_sdr_list.append(si_sdr_value)
-            
-            # print(f"File: {clean_file}, SI-SDR: {si_sdr_value}")
-
-    if si_sdr_list:
-        average_si_sdr = sum(si_sdr_list) / len(si_sdr_list)
+    return enhanced_signal[:min_length], clean_signal[:min_length]
+
+def calculate_si_sdr(enhanced_files, clean_files):
+    """SI-SDR of each pair, all pairs zero-padded into one (B, T) batch"""
+    enhanced_signals, clean_signals = zip(*[read_pair(e, c) for e, c in zip(enhanced_files, clean_files)])
+    enhanced_batch, lengths = pad_batch(enhanced_signals)
+    clean_batch, _ = pad_batch(clean_signals)
+    return batch_si_sdr(enhanced_batch, clean_batch, lengths, zero_mean=False).tolist()
+
+def calculate_average_si_sdr(clean_folder, enhanced_folder, batch_size=64, log=None, manifests=None):
+    """per-file SI-SDR goes to log (a ResultLog) as each batch completes, pairs already in it are skipped"""
+    log = log or ResultLog(None, ['file', 'si_sdr'])
+    pairs = [(e, c) for c, e in list_pairs(clean_folder, enhanced_folder, manifests)
+             if os.path.relpath(c, clean_folder) not in log.done]
+    if log.done:
+        print(f"Resuming: {len(log.done)} files already scored, {len(pairs)} to go")
+
+    for i in tqdm(range(0, len(pairs), batch_size), desc='Average SI-SDR calculating'):
+        enhanced_files, clean_files = zip(*pairs[i:i + batch_size])
+        for clean_file, value in zip(clean_files, calculate_si_sdr(enhanced_files, clean_files)):
+            log.write({'file': os.path.relpath(clean_file, clean_folder), 'si_sdr': value})
+
+    average_si_sdr = log.stats.mean('si_sdr')
+    if average_si_sdr is not None:
         print("Average SI-SDR:", average_si_sdr)
     else:
         print("No SI-SDR values calculated. Check if the folders contain matching WAV files.")
@@ -49,9 +51,14 @@ def main():
     parser = argparse.ArgumentParser(description="Calculate average SI-SDR for WAV files in specified folders.")
     parser.add_argument('--enhanced_folder','-e', type=str, required=True, help="Path to the folder containing enhanced WAV files")
     parser.add_argument('--clean_folder','-c', type=str, required=True, help="Path to the folder containing clean WAV files")
+    parser.add_argument('--batch_size', type=int, default=64, help="Pairs per zero-padded batch (default: 64)")
+    parser.add_argument('--output', '-o', type=str, default=None, help="Per-file results, appended as they complete (.jsonl, or .csv)")
+    parser.add_argument('--resume', action='store_true', help="Keep the results already in --output and score only the remaining files")
+    parser.add_argument('--manifest', type=str, nargs='+', default=None, help="Manifest(s) from manifest.py to look the files up in instead of listing the folders")
     args = parser.parse_args()
     
-    calculate_average_si_sdr(args.clean_folder, args.enhanced_folder)
+    with ResultLog(args.output, ['file', 'si_sdr'], resume=args.resume) as log:
+        calculate_average_si_sdr(args.clean_folder, args.enhanced_folder, args.batch_size, log, args.manifest)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
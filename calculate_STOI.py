@@ -1,56 +1,67 @@
 import argparse
 import os
-# import numpy as np
 from tqdm import tqdm
-import scipy.io.wavfile as wav
-from pystoi.stoi import stoi
-# from torchmetrics.audio import ShortTimeObjectiveIntelligibility
-# import torch
+from batch_stoi import batch_stoi
+from metric_cache import MetricCache, cached_map
+from result_log import ResultLog
+from manifest import list_pairs
+from wav_io import load_wav
 '''
 STOI:
 python calculate_STOI.py -c wav/clean/ -e wav/gtcrn_enh/
 eSTOI:
 python calculate_STOI.py -c wav/clean/ -e wav/gtcrn_enh/ --extended
+python calculate_STOI.py -c wav/clean/ -e wav/gtcrn_enh/ --extended --batch_size 128
+python calculate_STOI.py -c wav/clean/ -e wav/gtcrn_enh/ --cache metric_cache.sqlite
+python calculate_STOI.py -c wav/clean/ -e wav/gtcrn_enh/ -o stoi.jsonl --resume
+python calculate_STOI.py -c wav/clean/ -e wav/gtcrn_enh/ --manifest wav_manifest.tsv
 '''
 
-def calculate_stoi(clean_file, enhanced_file, extended):
-    fs_clean, clean_signal = wav.read(clean_file)
-    fs_enhanced, enhanced_signal = wav.read(enhanced_file)
+def read_pair(clean_file, enhanced_file):
+    clean_signal, fs_clean = load_wav(clean_file)
+    enhanced_signal, fs_enhanced = load_wav(enhanced_file)
     
     if fs_clean != fs_enhanced:
         raise ValueError("Sampling rates of the two files do not match.")
     
     min_len = min(len(clean_signal), len(enhanced_signal))
-    clean_signal = clean_signal[:min_len]
-    enhanced_signal = enhanced_signal[:min_len]
-    
-
-    stoi_value = stoi(clean_signal, enhanced_signal, fs_clean, extended=extended)
-    # stoi = ShortTimeObjectiveIntelligibility(fs_clean, extended)
-    # stoi_value = stoi(torch.tensor(enhanced_signal),torch.tensor(clean_signal)).item()
+    return clean_signal[:min_len], enhanced_signal[:min_len], fs_clean
 
+def calculate_stoi(clean_files, enhanced_files, extended):
+    """STOI (or eSTOI) of each pair, scored together by batch_stoi (grouped by sampling rate)"""
+    pairs = [read_pair(c, e) for c, e in zip(clean_files, enhanced_files)]
+    scores = [None] * len(pairs)
+    for fs in set(fs for _, _, fs in pairs):
+        idx = [i for i, pair in enumerate(pairs) if pair[2] == fs]
+        values = batch_stoi([pairs[i][0] for i in idx], [pairs[i][1] for i in idx], fs, extended=extended)
+        for i, value in zip(idx, values):
+            scores[i] = float(value)
+    return scores
 
-    return stoi_value
-
-def calculate_average_stoi(clean_folder, enhanced_folder, extended):
-    stoi_list = []
+def score_pairs(pairs, extended, batch_size):
+    """yields (STOI, None) of each pair in order, batch_size pairs at a time"""
     desc = 'Average eSTOI calculating' if extended else 'Average STOI calculating'
-    for clean_file in tqdm(os.listdir(clean_folder), desc=desc):
-        if clean_file.endswith('.wav'):
-            clean_path = os.path.join(clean_folder, clean_file)
-            enhanced_path = os.path.join(enhanced_folder, clean_file)
+    for i in tqdm(range(0, len(pairs), batch_size), desc=desc):
+        clean_files, enhanced_files = zip(*pairs[i:i + batch_size])
+        for score in calculate_stoi(clean_files, enhanced_files, extended):
+            yield score, None
 
-            if not os.path.exists(enhanced_path):
-                print(f"Enhanced file not found for: {clean_path}")
-                continue
+def calculate_average_stoi(clean_folder, enhanced_folder, extended, batch_size=64, cache=None, log=None, manifests=None):
+    """per-file scores go to log (a ResultLog) as they complete, pairs already in it are skipped"""
+    name = 'estoi' if extended else 'stoi'
+    log = log or ResultLog(None, ['file', name])
+    pairs = [(c, e) for c, e in list_pairs(clean_folder, enhanced_folder, manifests)
+             if os.path.relpath(c, clean_folder) not in log.done]
+    if log.done:
+        print(f"Resuming: {len(log.done)} files already scored, {len(pairs)} to go")
 
-            stoi_value = calculate_stoi(clean_path, enhanced_path, extended)
-            stoi_list.append(stoi_value)
-            
-            # print(f"File: {clean_file}, STOI: {stoi_value}")
+    # batch_stoi's own version: bump if its scores ever change
+    results = cached_map(cache, name, 'batch_stoi=1', pairs, lambda todo: score_pairs(todo, extended, batch_size))
+    for (clean_path, _), (score, _) in zip(pairs, results):
+        log.write({'file': os.path.relpath(clean_path, clean_folder), name: score})
 
-    if stoi_list:
-        average_stoi = sum(stoi_list) / len(stoi_list)
+    average_stoi = log.stats.mean(name)
+    if average_stoi is not None:
         if extended:
             print("Average eSTOI:", average_stoi)
         else:
@@ -63,9 +74,20 @@ def main():
     parser.add_argument('--clean_folder', '-c', type=str, required=True, help="Path to the folder containing clean WAV files")
     parser.add_argument('--enhanced_folder', '-e', type=str, required=True, help="Path to the folder containing enhanced WAV files")
     parser.add_argument('--extended', action='store_true', help="Calculate eSTOI if this flag is set (default: STOI)")
+    parser.add_argument('--batch_size', type=int, default=64, help="Pairs read and scored together (default: 64)")
+    parser.add_argument('--cache', type=str, default=None, help="SQLite result cache: only new or changed pairs are scored (default: no cache)")
+    parser.add_argument('--cache_size_mb', type=float, default=256, help="Cache size bound, least recently used results evicted first (default: 256)")
+    parser.add_argument('--output', '-o', type=str, default=None, help="Per-file results, appended as they complete (.jsonl, or .csv)")
+    parser.add_argument('--resume', action='store_true', help="Keep the results already in --output and score only the remaining files")
+    parser.add_argument('--manifest', type=str, nargs='+', default=None, help="Manifest(s) from manifest.py to look the files up in instead of listing the folders")
     args = parser.parse_args()
     
-    calculate_average_stoi(args.clean_folder, args.enhanced_folder, args.extended)
+    with ResultLog(args.output, ['file', 'estoi' if args.extended else 'stoi'], resume=args.resume) as log:
+        if args.cache:
+            with MetricCache(args.cache, args.cache_size_mb) as cache:
+                calculate_average_stoi(args.clean_folder, args.enhanced_folder, args.extended, args.batch_size, cache, log, args.manifest)
+        else:
+            calculate_average_stoi(args.clean_folder, args.enhanced_folder, args.extended, args.batch_size, log=log, manifests=args.manifest)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,235 @@
+import os
+import math
+import argparse
+import contextlib
+from functools import partial
+import numpy as np
+from batch_si_sdr import si_sdr
+from metric_cache import MetricCache, pool_map
+from result_log import ResultLog
+from manifest import list_pairs
+from wav_io import read_audio
+
+'''
+PESQ (wb, nb), STOI, eSTOI, SI-SNR and SI-SDR in one pass, each clean/enhanced pair decoded once:
+python calculate_metrics.py -c wav/clean -e wav/gtcrn_enh
+python calculate_metrics.py -c wav/clean -e wav/gtcrn_enh --metrics pesq_wb stoi si_snr -o metrics.csv
+python calculate_metrics.py -c wav/clean -e wav/gtcrn_enh --jobs 8
+python calculate_metrics.py -c wav/clean -e wav/gtcrn_enh --metrics stoi estoi --batch_size 128
+python calculate_metrics.py -c wav/clean -e wav/gtcrn_enh --cache metric_cache.sqlite
+python calculate_metrics.py -c wav/clean -e wav/gtcrn_enh -o metrics.csv --resume
+python calculate_metrics.py -c wav/clean -e wav/gtcrn_enh --manifest wav_manifest.tsv
+'''
+
+METRICS = ['pesq_wb', 'pesq_nb', 'stoi', 'estoi', 'si_snr', 'si_sdr']
+METRIC_NAMES = {'pesq_wb': 'PESQ wb', 'pesq_nb': 'PESQ nb', 'stoi': 'STOI', 'estoi': 'eSTOI', 'si_snr': 'SI-SNR', 'si_sdr': 'SI-SDR'}
+# scored for a whole batch of pairs at once by batch_stoi, the others pair by pair
+BATCHED = ('stoi', 'estoi')
+
+
+def load_metric_functions(metrics):
+    """metric name -> fn(clean, enhanced, fs) of the per-pair metrics, importing pesq/scipy only when asked for"""
+    functions = {}
+    if 'pesq_wb' in metrics or 'pesq_nb' in metrics:
+        # the scores calculate_PESQ.py caches under the same keys
+        from calculate_PESQ import pesq_any_rate
+        functions['pesq_wb'] = lambda clean, enhanced, fs: pesq_any_rate(clean, enhanced, fs, 'wb')
+        functions['pesq_nb'] = lambda clean, enhanced, fs: pesq_any_rate(clean, enhanced, fs, 'nb')
+    functions['si_snr'] = lambda clean, enhanced, fs: si_sdr(enhanced, clean, zero_mean=True)
+    functions['si_sdr'] = lambda clean, enhanced, fs: si_sdr(enhanced, clean)
+    return {name: functions[name] for name in metrics if name not in BATCHED}
+
+
+def cache_keys(metrics):
+    """metric name -> (metric, params) of its MetricCache entries, the keys calculate_PESQ.py and calculate_STOI.py use"""
+    keys = {'stoi': ('stoi', 'batch_stoi=1'), 'estoi': ('estoi', 'batch_stoi=1'),
+            'si_snr': ('si_snr', 'batch_si_sdr=1'), 'si_sdr': ('si_sdr', 'batch_si_sdr=1')}
+    if 'pesq_wb' in metrics or 'pesq_nb' in metrics:
+        from calculate_PESQ import pesq_params
+        keys.update(pesq_wb=('pesq', pesq_params('wb')), pesq_nb=('pesq', pesq_params('nb')))
+    return {name: keys[name] for name in metrics}
+
+
+def batched_scores(signals, metrics):
+    """
+    signals: [(clean, enhanced, fs)] -> {metric: (B,) scores} of the BATCHED metrics, one batch_stoi call
+    per sampling rate for STOI and eSTOI together (they share the resampling and the 1/3 octave bands)
+    """
+    from batch_stoi import batch_stoi
+    names = [name for name in BATCHED if name in metrics]
+    scores = {name: np.full(len(signals), math.nan) for name in names}
+    for fs in set(s[2] for s in signals):
+        idx = [i for i, s in enumerate(signals) if s[2] == fs]
+        values = batch_stoi([signals[i][0] for i in idx], [signals[i][1] for i in idx], fs,
+                            extended=tuple(name == 'estoi' for name in names))
+        for name, row in zip(names, values):
+            scores[name][idx] = row
+    return scores
+
+
+def read_pair(clean_path, enhanced_path):
+    clean, fs_clean = read_audio(clean_path, dtype=np.float64)
+    enhanced, fs_enhanced = read_audio(enhanced_path, dtype=np.float64)
+    if fs_clean != fs_enhanced:
+        raise ValueError(f"Sampling rates of the two files do not match: {fs_clean} Hz, {fs_enhanced} Hz")
+    m = min(len(clean), len(enhanced))
+    return clean[:m], enhanced[:m], fs_clean
+
+
+# per-process metric functions, loaded on the first batch
+_functions = {}
+
+def score_batch(batch, metrics):
+    """
+    [(clean_path, enhanced_path, names)] -> [({metric: value}, errors)] of the metrics in names (a subset of
+    metrics) for each pair, STOI/eSTOI batched over the pairs.
+    A metric that fails (e.g. pesq.NoUtterancesError on a silent file) is NaN and reported in errors.
+    """
+    if metrics not in _functions:
+        _functions[metrics] = load_metric_functions(metrics)
+    results, signals, read = [], [], []
+    for clean_path, enhanced_path, names in batch:
+        results.append(({name: math.nan for name in names}, []))
+        try:
+            signals.append(read_pair(clean_path, enhanced_path))
+            read.append(len(results) - 1)
+        except Exception as e:
+            results[-1][1].append(f"{type(e).__name__}: {e}")
+    for i, (clean, enhanced, fs) in zip(read, signals):
+        row, errors = results[i]
+        for name, fn in _functions[metrics].items():
+            if name not in row:
+                continue
+            try:
+                row[name] = float(fn(clean, enhanced, fs))
+            except Exception as e:
+                errors.append(f"{METRIC_NAMES[name]}: {type(e).__name__}: {e}")
+    # pairs that need the same STOI/eSTOI share a batch_stoi call (all of them, unless some came from the cache)
+    groups = {}
+    for j, i in enumerate(read):
+        names = tuple(name for name in BATCHED if name in results[i][0])
+        if names:
+            groups.setdefault(names, []).append(j)
+    for names, group in groups.items():
+        try:
+            scores = batched_scores([signals[j] for j in group], names)
+        except Exception:
+            # find the pair(s) batch_stoi rejects, the others keep their scores
+            scores = {name: np.full(len(group), math.nan) for name in names}
+            for k, j in enumerate(group):
+                try:
+                    for name, values in batched_scores([signals[j]], names).items():
+                        scores[name][k] = values[0]
+                except Exception as e:
+                    results[read[j]][1].append(f"{'/'.join(METRIC_NAMES[n] for n in names)}: {type(e).__name__}: {e}")
+        for name, values in scores.items():
+            for j, value in zip(group, values):
+                results[read[j]][0][name] = float(value)
+    return results
+
+
+def score_pairs(pairs, metrics, jobs=1, chunk_size=None, batch_size=64, needed=None):
+    """
+    yields score_batch's (scores, errors) of each pair in order, as they complete, batch_size pairs per batch.
+    needed: the metrics to score for each pair (default: all of metrics).
+    With jobs > 1 batches hold at most chunk_size pairs (default: about 4 batches per worker).
+    """
+    desc = 'Calculating ' + ', '.join(METRIC_NAMES[m] for m in metrics)
+    if jobs > 1:
+        batch_size = min(batch_size, chunk_size or max(1, math.ceil(len(pairs) / (jobs * 4))))
+    items = [(c, e, names) for (c, e), names in zip(pairs, needed or [metrics] * len(pairs))]
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    for results in pool_map(partial(score_batch, metrics=metrics), batches, jobs, 1, desc):
+        yield from results
+
+
+def calculate_metrics(pairs, metrics, jobs=1, chunk_size=None, cache=None, batch_size=64, store_every=256):
+    """
+    pairs: [(clean_path, enhanced_path)] -> yields one {'file': ..., metric: value} row per pair, in order, as they complete.
+    With a MetricCache each metric is looked up and stored under its own cache_keys entry, so results are shared
+    with calculate_PESQ.py / calculate_STOI.py and across --metrics selections; only the metrics missing for a
+    pair are scored, and every score that is not NaN is stored.
+    """
+    metrics = tuple(metrics)
+    cached = [{} for _ in pairs]
+    if cache is not None:
+        keys = cache_keys(metrics)
+        hashes = [(cache.file_hash(clean), cache.file_hash(enhanced)) for clean, enhanced in pairs]
+        for name, (metric, params) in keys.items():
+            for row, value in zip(cached, cache.get_many(metric, params, hashes)):
+                if value is not None:
+                    row[name] = value
+        hits = sum(len(row) for row in cached)
+        if hits:
+            print(f"{hits} of {len(pairs) * len(metrics)} results from the cache")
+    needed = [tuple(name for name in metrics if name not in row) for row in cached]
+    todo = [i for i, names in enumerate(needed) if names]
+    computed = score_pairs([pairs[i] for i in todo], metrics, jobs, chunk_size, batch_size,
+                           [needed[i] for i in todo]) if todo else iter([])
+    new = {name: [] for name in metrics}
+
+    def store():
+        for name, items in new.items():
+            if items:
+                cache.put_many(*keys[name], items)
+                items.clear()
+    try:
+        for i, ((clean_path, _), row) in enumerate(zip(pairs, cached)):
+            if needed[i]:
+                scores, errors = next(computed)
+                for error in errors:
+                    print(f"Failed for {clean_path}: {error}")
+                row.update(scores)
+                if cache is not None:
+                    for name, value in scores.items():
+                        if not math.isnan(value):
+                            new[name].append((hashes[i], value))
+                    # stored before the last computed row is handed out, as in cached_map
+                    if sum(map(len, new.values())) >= store_every or i == todo[-1]:
+                        store()
+            yield {'file': os.path.basename(clean_path), **{name: row[name] for name in metrics}}
+    finally:
+        if cache is not None:
+            store()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calculate PESQ/STOI/eSTOI/SI-SNR/SI-SDR for WAV files in specified folders in one pass.")
+    parser.add_argument('--clean_folder', '-c', type=str, required=True, help="Path to the folder containing clean WAV files")
+    parser.add_argument('--enhanced_folder', '-e', type=str, required=True, help="Path to the folder containing enhanced WAV files")
+    parser.add_argument('--metrics', '-m', type=str, nargs='+', choices=METRICS, default=METRICS, help="Metrics to compute (default: all)")
+    parser.add_argument('--output', '-o', type=str, default=None, help="Per-file rows, appended as they complete (.csv, or .jsonl)")
+    parser.add_argument('--resume', action='store_true', help="Keep the rows already in --output and score only the remaining files")
+    parser.add_argument('--jobs', '-j', type=int, default=1, help="Worker processes (default: 1, sequential)")
+    parser.add_argument('--chunk_size', type=int, default=None, help="Pairs handed to a worker at a time, at most --batch_size (default: about 4 chunks per worker)")
+    parser.add_argument('--batch_size', type=int, default=64, help="Pairs read and scored together, STOI/eSTOI batched over them (default: 64)")
+    parser.add_argument('--cache', type=str, default=None, help="SQLite result cache: only new or changed pairs are scored (default: no cache)")
+    parser.add_argument('--cache_size_mb', type=float, default=256, help="Cache size bound, least recently used results evicted first (default: 256)")
+    parser.add_argument('--manifest', type=str, nargs='+', default=None, help="Manifest(s) from manifest.py to look the files up in instead of listing the folders")
+    args = parser.parse_args()
+
+    metrics = [m for m in METRICS if m in args.metrics]
+    with ResultLog(args.output, ['file'] + metrics, resume=args.resume) as log:
+        pairs = [(c, e) for c, e in list_pairs(args.clean_folder, args.enhanced_folder, args.manifest)
+                 if os.path.relpath(c, args.clean_folder) not in log.done]
+        if log.done:
+            print(f"Resuming: {len(log.done)} files already scored, {len(pairs)} to go")
+        with MetricCache(args.cache, args.cache_size_mb) if args.cache else contextlib.nullcontext() as cache:
+            for (clean_path, _), row in zip(pairs, calculate_metrics(pairs, metrics, args.jobs, args.chunk_size, cache, args.batch_size)):
+                # relative to the clean folder, the basename is not unique in a recursive manifest
+                row['file'] = os.path.relpath(clean_path, args.clean_folder)
+                log.write(row)
+    if not log.count:
+        print("No metrics calculated. Check if the folders contain matching WAV files.")
+        return
+    if args.output:
+        print(f"Per-file metrics saved to: {args.output}")
+    for name in metrics:
+        failed, count = log.stats.failed.get(name, 0), log.stats.count.get(name, 0)
+        if failed:
+            print(f"{METRIC_NAMES[name]}: {failed} of {failed + count} files failed and are left out of the average")
+        if count:
+            print(f"Average {METRIC_NAMES[name]}:", log.stats.mean(name))
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 import argparse
-from scipy.io import wavfile
+from wav_io import load_wav
 from pesq import pesq
 
 '''
@@ -8,8 +8,8 @@ python calculate_wavfile_PESQ.py --clean_file wav/clean/p232_001.wav --enhanced_
 '''
 
 def calculate_pesq(clean_file, enhanced_file, mode):
-    rate, ref = wavfile.read(clean_file)
-    rate, deg = wavfile.read(enhanced_file)
+    ref, rate = load_wav(clean_file)
+    deg, rate = load_wav(enhanced_file)
     pesq_score = pesq(rate, ref, deg, mode)
     return pesq_score
 
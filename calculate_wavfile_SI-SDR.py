@@ -2,7 +2,8 @@ import os
 import argparse
 import torch
 from torchmetrics.audio import ScaleInvariantSignalDistortionRatio
-import soundfile as sf
+import numpy as np
+from wav_io import read_audio
 
 '''
 python calculate_wavfile_SI-SDR.py --clean_file wav/clean/p232_001.wav --enhanced_file wav/gtcrn_enh/p232_001.wav
@@ -13,8 +14,8 @@ https://lightning.ai/docs/torchmetrics/stable/audio/scale_invariant_signal_disto
 '''
 
 def calculate_si_sdr(enhanced_file, clean_file):
-    enhanced_signal, _ = sf.read(enhanced_file)
-    clean_signal, _ = sf.read(clean_file)
+    enhanced_signal, _ = read_audio(enhanced_file, dtype=np.float64)
+    clean_signal, _ = read_audio(clean_file, dtype=np.float64)
 
     min_length = min(len(clean_signal), len(enhanced_signal))
     clean_signal = clean_signal[:min_length]
@@ -2,7 +2,8 @@ import os
 import argparse
 import torch
 from torchmetrics.functional.audio import scale_invariant_signal_noise_ratio
-import soundfile as sf
+import numpy as np
+from wav_io import read_audio
 
 '''
 python calculate_si_snr.py --clean_file wav/clean/p232_001.wav --enhanced_file wav/enhanced/p232_001.wav
@@ -13,8 +14,8 @@ https://lightning.ai/docs/torchmetrics/stable/audio/scale_invariant_signal_noise
 '''
 
 def calculate_si_snr(enhanced_file, clean_file):
-    enhanced_signal, _ = sf.read(enhanced_file)
-    clean_signal, _ = sf.read(clean_file)
+    enhanced_signal, _ = read_audio(enhanced_file, dtype=np.float64)
+    clean_signal, _ = read_audio(clean_file, dtype=np.float64)
 
     min_length = min(len(clean_signal), len(enhanced_signal))
     clean_signal = clean_signal[:min_length]
@@ -1,6 +1,6 @@
 import argparse
 import numpy as np
-import scipy.io.wavfile as wav
+from wav_io import load_wav
 from pystoi.stoi import stoi
 
 '''
@@ -15,8 +15,8 @@ python calculate_wavfile_STOI.py -c wav/clean/p232_005.wav -e wav/gtcrn_enh/p232
 '''
 
 def calculate_stoi(clean_file, enhanced_file, extended):
-    fs_clean, clean_signal = wav.read(clean_file)
-    fs_enhanced, enhanced_signal = wav.read(enhanced_file)
+    clean_signal, fs_clean = load_wav(clean_file)
+    enhanced_signal, fs_enhanced = load_wav(enhanced_file)
     
     if fs_clean != fs_enhanced:
         raise ValueError("Sampling rates of the two files do not match.")
@@ -1,15 +1,17 @@
 import argparse
+import collections
 import concurrent.futures
-import glob
 import os
 
 import librosa
 import numpy as np
 import numpy.polynomial.polynomial as poly
 import onnxruntime as ort
-import pandas as pd
-import soundfile as sf
 from tqdm import tqdm
+from metric_cache import MetricCache, cached_map
+from result_log import ResultLog
+from manifest import list_files
+from wav_io import read_audio
 
 '''
 https://github.com/microsoft/DNS-Challenge/blob/master/DNSMOS/dnsmos_local.py
@@ -17,10 +19,14 @@ https://github.com/microsoft/DNS-Challenge/blob/master/DNSMOS/dnsmos_local.py
 
 '''
 python evaluate_dnsmos.py -t wav/noisy
+python evaluate_dnsmos.py -t wav/noisy --cache metric_cache.sqlite
+python evaluate_dnsmos.py -t wav/noisy -o dnsmos.jsonl --resume
+python evaluate_dnsmos.py -t wav/noisy --manifest wav_manifest.tsv
 '''
 
 SAMPLING_RATE = 16000
 INPUT_LENGTH = 9.01
+FIELDS = ['filename', 'len_in_sec', 'sr', 'num_hops', 'OVRL_raw', 'SIG_raw', 'BAK_raw', 'OVRL', 'SIG', 'BAK', 'P808_MOS']
 
 class ComputeScore:
     def __init__(self, primary_model_path, p808_model_path) -> None:
@@ -50,12 +56,9 @@ class ComputeScore:
         return sig_poly, bak_poly, ovr_poly
 
     def __call__(self, fpath, sampling_rate, is_personalized_MOS):
-        aud, input_fs = sf.read(fpath)
         fs = sampling_rate
-        if input_fs != fs:
-            audio = librosa.resample(aud, input_fs, fs)
-        else:
-            audio = aud
+        # float64 as before, resampled only if the clip is not at fs
+        audio, _ = read_audio(fpath, sr=fs, dtype=np.float64, mono=True)
         actual_audio_len = len(audio)
         len_samples = int(INPUT_LENGTH*fs)
         while len(audio) < len_samples:
@@ -102,41 +105,67 @@ class ComputeScore:
         clip_dict['P808_MOS'] = np.mean(predicted_p808_mos)
         return clip_dict
 
-def main(args):
+def clip_result(clip, future):
+    try:
+        data = future.result()
+    except Exception as exc:
+        return None, f'{clip} generated an exception: {exc}'
+    # plain floats, so the row can go to the JSON result log and cache
+    return {k: v.item() if isinstance(v, np.generic) else v for k, v in data.items()}, None
+
+def score_clips(compute_score, clips, desired_fs, is_personalized_eval, workers=None):
+    """
+    yields (clip_dict, None) of each clip in order as they complete, (None, error) for a clip that raised.
+    At most 2 x workers clips are in flight, so memory does not grow with the number of clips.
+    """
+    workers = workers or min(32, (os.cpu_count() or 1) + 4)  # ThreadPoolExecutor's default
+    pending = collections.deque()
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor, tqdm(total=len(clips)) as pbar:
+        for clip in clips:
+            pending.append((clip, executor.submit(compute_score, clip, desired_fs, is_personalized_eval)))
+            if len(pending) >= 2 * workers:
+                yield clip_result(*pending.popleft())
+                pbar.update()
+        while pending:
+            yield clip_result(*pending.popleft())
+            pbar.update()
+
+def main(args, cache=None, log=None):
     p808_model_path = os.path.join('DNSMOS', 'model_v8.onnx')
     primary_model_path = os.path.join('DNSMOS', 'sig_bak_ovr.onnx')
     print(f'Using model: {primary_model_path}')
 
     compute_score = ComputeScore(primary_model_path, p808_model_path)
 
-    clips = glob.glob(os.path.join(args.testset_dir, "*.wav"))
+    log = log or ResultLog(None, FIELDS, key='filename')
+    clips = [clip for clip in list_files(args.testset_dir, args.manifest) if clip not in log.done]
     is_personalized_eval = args.personalized_MOS
     desired_fs = SAMPLING_RATE
     
     # Print the number of clips being processed
     print(f"Processing {len(clips)} audio files...")
-
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        future_to_clip = {executor.submit(compute_score, clip, desired_fs, is_personalized_eval): clip for clip in clips}
-        rows = []
-        for future in tqdm(concurrent.futures.as_completed(future_to_clip), total=len(clips)):
-            clip = future_to_clip[future]
-            try:
-                data = future.result()
-            except Exception as exc:
-                print(f'{clip} generated an exception: {exc}')
-            else:
-                rows.append(data)
-
-    df = pd.DataFrame(rows)
-
-    mean_OVRL_raw = df['OVRL_raw'].mean()
-    mean_SIG_raw = df['SIG_raw'].mean()
-    mean_BAK_raw = df['BAK_raw'].mean()
-    mean_OVRL = df['OVRL'].mean()
-    mean_SIG = df['SIG'].mean()
-    mean_BAK = df['BAK'].mean()
-    mean_P808_MOS = df['P808_MOS'].mean()
+    if log.done:
+        print(f"Resuming: {len(log.done)} files already scored")
+
+    params = f'personalized={is_personalized_eval};sr={desired_fs}'
+    if cache is not None:
+        params += f';models={cache.file_hash(primary_model_path)},{cache.file_hash(p808_model_path)}'
+    results = cached_map(cache, 'dnsmos', params, [(None, clip) for clip in clips],
+                         lambda todo: score_clips(compute_score, [clip for _, clip in todo], desired_fs, is_personalized_eval))
+    for clip, (data, error) in zip(clips, results):
+        if error:
+            print(error)
+            continue
+        data['filename'] = clip
+        log.write(data)
+
+    mean_OVRL_raw = log.stats.mean('OVRL_raw')
+    mean_SIG_raw = log.stats.mean('SIG_raw')
+    mean_BAK_raw = log.stats.mean('BAK_raw')
+    mean_OVRL = log.stats.mean('OVRL')
+    mean_SIG = log.stats.mean('SIG')
+    mean_BAK = log.stats.mean('BAK')
+    mean_P808_MOS = log.stats.mean('P808_MOS')
 
     # print(f"Average OVRL_raw: {mean_OVRL_raw}")
     # print(f"Average SIG_raw: {mean_SIG_raw}")
@@ -146,6 +175,10 @@ def main(args):
     # print(f"Average BAK: {mean_BAK}")
     # print(f"Average P808_MOS: {mean_P808_MOS}")
 
+    if mean_OVRL is None:
+        print("No clips scored.")
+        return
+
     result = {
         'OVRL': round(mean_OVRL, 3),
         'SIG' : round(mean_SIG, 3),
@@ -161,6 +194,23 @@ if __name__=="__main__":
     parser.add_argument('-p', "--personalized_MOS", action='store_true', 
                         help='Flag to indicate if personalized MOS score is needed or regular')
     
+    parser.add_argument("--cache", default=None,
+                        help='SQLite result cache: only new or changed clips are scored (default: no cache)')
+    parser.add_argument("--cache_size_mb", type=float, default=256,
+                        help='Cache size bound, least recently used results evicted first (default: 256)')
+    
+    parser.add_argument("--manifest", nargs='+', default=None,
+                        help='Manifest(s) from manifest.py to look the clips up in instead of listing the dir')
+    parser.add_argument('-o', "--output", default=None,
+                        help='Per-clip results, appended as they complete (.jsonl, or .csv)')
+    parser.add_argument("--resume", action='store_true',
+                        help='Keep the results already in --output and score only the remaining clips')
+    
     args = parser.parse_args()
 
-    main(args)
+    with ResultLog(args.output, FIELDS, resume=args.resume, key='filename') as log:
+        if args.cache:
+            with MetricCache(args.cache, args.cache_size_mb) as cache:
+                main(args, cache, log)
+        else:
+            main(args, log=log)
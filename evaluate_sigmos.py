@@ -1,44 +1,64 @@
 import argparse
+import contextlib
 import os
 from sigmos.sigmos import SigMOS
-import librosa
+from wav_io import read_audio
 from tqdm import tqdm
+from metric_cache import MetricCache, cached_map
+from result_log import ResultLog
+from manifest import list_files
 
 '''
 python evaluate_sigmos.py --audio_dir ./wav/clean
+python evaluate_sigmos.py --audio_dir ./wav/clean --cache metric_cache.sqlite
+python evaluate_sigmos.py --audio_dir ./wav/clean -o sigmos.jsonl --resume
+python evaluate_sigmos.py --audio_dir ./wav/clean --manifest wav_manifest.tsv
 '''
 
+def score_files(sigmos_estimator, file_paths, sr):
+    """yields (SigMOS result dict, None) of each file in order"""
+    for file_path in tqdm(file_paths):
+        # Load the audio file
+        audio, fs = read_audio(file_path, sr=sr, mono=True)
+        # Run the SigMOS estimator
+        result = sigmos_estimator.run(audio, fs)
+        yield {key: float(value) for key, value in result.items()}, None
+
 def main():
     parser = argparse.ArgumentParser(description='Run the SigMOS estimator on all audio files in a directory.')
     parser.add_argument('--audio_dir', type=str, required=True, help='Path to the directory containing audio files')
     parser.add_argument('--model_dir', type=str, default='./sigmos', help='Directory where the model is stored')
     parser.add_argument('--sr', type=int, default=48000, help='Sampling rate to resample the audio to (default: 48000)')
+    parser.add_argument('--cache', type=str, default=None, help='SQLite result cache: only new or changed files are scored (default: no cache)')
+    parser.add_argument('--cache_size_mb', type=float, default=256, help='Cache size bound, least recently used results evicted first (default: 256)')
+    parser.add_argument('--output', '-o', type=str, default=None, help='Per-file results, appended as they complete (.jsonl, or .csv)')
+    parser.add_argument('--resume', action='store_true', help='Keep the results already in --output and score only the remaining files')
+    parser.add_argument('--manifest', type=str, nargs='+', default=None, help='Manifest(s) from manifest.py to look the files up in instead of listing the directory')
 
     args = parser.parse_args()
 
     sigmos_estimator = SigMOS(model_dir=args.model_dir)
-    total_results = {'MOS_COL': 0, 'MOS_DISC': 0, 'MOS_LOUD': 0, 'MOS_NOISE': 0, 'MOS_REVERB': 0, 'MOS_SIG': 0, 'MOS_OVRL': 0}
-    file_count = 0
-
-    # Iterate over all files in the specified directory
-    for filename in tqdm(os.listdir(args.audio_dir)):
-        if filename.endswith('.wav'):  # Assuming audio files are in WAV format
-            file_path = os.path.join(args.audio_dir, filename)
-            # Load the audio file
-            audio, sr = librosa.load(file_path, sr=args.sr)
-            # Run the SigMOS estimator
-            result = sigmos_estimator.run(audio, sr)
-            # Accumulate the results
-            for key in total_results.keys():
-                total_results[key] += result[key]
-            file_count += 1
+    keys = ['MOS_COL', 'MOS_DISC', 'MOS_LOUD', 'MOS_NOISE', 'MOS_REVERB', 'MOS_SIG', 'MOS_OVRL']
+    with ResultLog(args.output, ['file'] + keys, resume=args.resume) as log, \
+            MetricCache(args.cache, args.cache_size_mb) if args.cache else contextlib.nullcontext() as cache:
+        # All WAV files in the specified directory, less those already in the result log
+        file_paths = [path for path in list_files(args.audio_dir, args.manifest) if os.path.relpath(path, args.audio_dir) not in log.done]
+        if log.done:
+            print(f"Resuming: {len(log.done)} files already scored, {len(file_paths)} to go")
+        params = f'sr={args.sr}'
+        if cache is not None:
+            model_files = sorted(f for f in os.listdir(args.model_dir) if f.endswith('.onnx'))
+            params += ';models=' + ','.join(cache.file_hash(os.path.join(args.model_dir, f)) for f in model_files)
+        results = cached_map(cache, 'sigmos', params, [(None, path) for path in file_paths],
+                             lambda todo: score_files(sigmos_estimator, [path for _, path in todo], args.sr))
+        for file_path, (result, _) in zip(file_paths, results):
+            # Log the results, the averages are accumulated as they come
+            log.write({'file': os.path.relpath(file_path, args.audio_dir), **{key: result[key] for key in keys}})
 
-    if file_count > 0:
-        # Calculate the average results
-        avg_results = {key: total_results[key] / file_count for key in total_results.keys()}
+    if log.count:
         print("Average SigMOS Results:")
-        for key, value in avg_results.items():
-            print(f"{key}: {value:.4f}")
+        for key in keys:
+            print(f"{key}: {log.stats.mean(key):.4f}")
     else:
         print("No audio files found in the specified directory.")
 
@@ -1,6 +1,6 @@
 import argparse
 from sigmos.sigmos import SigMOS
-import librosa
+from wav_io import read_audio
 
 '''
 python evaluate_wavfile_sigmos.py -a ../dataset/clean_testset_wav/p232_041.wav
@@ -16,7 +16,7 @@ def main():
 
     sigmos_estimator = SigMOS(model_dir=args.model_dir)
 
-    audio, sr = librosa.load(args.audio_file, sr=args.sr)
+    audio, sr = read_audio(args.audio_file, sr=args.sr, mono=True)
 
     result = sigmos_estimator.run(audio, sr)
     print(result)
@@ -5,7 +5,6 @@ Ultra tiny, 33.0 MMACs, 23.67 K params
 import torch
 import numpy as np
 import torch.nn as nn
-from einops import rearrange
 
 
 class ERB(nn.Module):
@@ -102,6 +101,38 @@ class TRA(nn.Module):
         return x * At
 
 
+def deconv_to_conv(deconv):
+    """Rewrite a stride-1 ConvTranspose2d as the equivalent Conv2d"""
+    assert deconv.stride == (1, 1)
+    k, d, p, g = deconv.kernel_size, deconv.dilation, deconv.padding, deconv.groups
+    padding = tuple(d[i]*(k[i]-1) - p[i] for i in range(2))
+    assert min(padding) >= 0
+    conv = nn.Conv2d(deconv.in_channels, deconv.out_channels, k,
+                     padding=padding, dilation=d, groups=g, bias=deconv.bias is not None)
+    w = deconv.weight.data  # (Cin, Cout/g, kh, kw)
+    w = w.reshape(g, w.shape[0]//g, *w.shape[1:]).transpose(1, 2)
+    conv.weight.data = w.reshape(-1, *w.shape[2:]).flip([2, 3]).contiguous()
+    if deconv.bias is not None:
+        conv.bias.data = deconv.bias.data.clone()
+    return conv
+
+
+def fuse_conv_bn(conv, bn):
+    """Fold an eval-mode BatchNorm2d into the preceding (transposed) conv"""
+    scale = bn.weight.data / torch.sqrt(bn.running_var + bn.eps)
+    bias = conv.bias.data if conv.bias is not None else torch.zeros_like(bn.running_mean)
+    if isinstance(conv, nn.ConvTranspose2d):
+        w = conv.weight.data  # (Cin, Cout/g, kh, kw)
+        g = conv.groups
+        w = w.reshape(g, w.shape[0]//g, w.shape[1], *w.shape[2:])
+        w = w * scale.reshape(g, 1, -1, 1, 1)
+        conv.weight.data = w.reshape(conv.weight.shape)
+    else:
+        conv.weight.data = conv.weight.data * scale.reshape(-1, 1, 1, 1)
+    conv.bias = nn.Parameter((bias - bn.running_mean) * scale + bn.bias.data)
+    return conv
+
+
 class ConvBlock(nn.Module):
     def __init__(self, in_channels, out_channels, kernel_size, stride, padding, groups=1, use_deconv=False, is_last=False):
         super().__init__()
@@ -114,6 +145,12 @@ class ConvBlock(nn.Module):
     def forward(self, x):
         return self.act(self.bn(self.conv(x)))
 
+    def fuse(self):
+        if isinstance(self.conv, nn.ConvTranspose2d) and self.conv.stride == (1, 1):
+            self.conv = deconv_to_conv(self.conv)
+        self.conv = fuse_conv_bn(self.conv, self.bn)
+        self.bn = nn.Identity()
+
 
 class GTConvBlock(nn.Module):
     """Group Temporal Convolution"""
@@ -141,12 +178,21 @@ class GTConvBlock(nn.Module):
 
         self.tra = TRA(in_channels//2)
 
+    def fuse(self):
+        for conv_name, bn_name in [('point_conv1', 'point_bn1'),
+                                   ('depth_conv', 'depth_bn'),
+                                   ('point_conv2', 'point_bn2')]:
+            conv = getattr(self, conv_name)
+            if isinstance(conv, nn.ConvTranspose2d):
+                conv = deconv_to_conv(conv)
+            setattr(self, conv_name, fuse_conv_bn(conv, getattr(self, bn_name)))
+            setattr(self, bn_name, nn.Identity())
+        self.use_deconv = False
+
     def shuffle(self, x1, x2):
         """x1, x2: (B,C,T,F)"""
-        x = torch.stack([x1, x2], dim=1)
-        x = x.transpose(1, 2).contiguous()  # (B,C,2,T,F)
-        x = rearrange(x, 'b c g t f -> b (c g) t f')  # (B,2C,T,F)
-        return x
+        x = torch.stack([x1, x2], dim=2)  # (B,C,2,T,F)
+        return x.flatten(1, 2)  # (B,2C,T,F), a view
 
     def forward(self, x):
         """x: (B, C, T, F)"""
@@ -186,10 +232,10 @@ class GRNN(nn.Module):
         if h == None:
             if self.bidirectional:
                 h = torch.zeros(self.num_layers*2,
-                                x.shape[0], self.hidden_size, device=x.device)
+                                x.shape[0], self.hidden_size, device=x.device, dtype=x.dtype)
             else:
                 h = torch.zeros(self.num_layers,
-                                x.shape[0], self.hidden_size, device=x.device)
+                                x.shape[0], self.hidden_size, device=x.device, dtype=x.dtype)
         x1, x2 = torch.chunk(x, chunks=2, dim=-1)
         h1, h2 = torch.chunk(h, chunks=2, dim=-1)
         h1, h2 = h1.contiguous(), h2.contiguous()
@@ -200,6 +246,52 @@ class GRNN(nn.Module):
         return y, h
 
 
+class FusedGRNN(nn.Module):
+    """
+    GRNN with both groups in one nn.GRU with block-diagonal weights, a single
+    RNN call instead of chunk + two GRUs + cat. Built from a (trained) GRNN.
+    """
+
+    def __init__(self, grnn):
+        super().__init__()
+        assert grnn.num_layers == 1, "FusedGRNN supports single-layer GRNN only"
+        self.hidden_size = grnn.hidden_size
+        self.num_layers = grnn.num_layers
+        self.bidirectional = grnn.bidirectional
+        rnn1, rnn2 = grnn.rnn1, grnn.rnn2
+        self.rnn = nn.GRU(rnn1.input_size*2, rnn1.hidden_size*2, rnn1.num_layers,
+                          batch_first=rnn1.batch_first, bidirectional=rnn1.bidirectional)
+
+        H, I = rnn1.hidden_size, rnn1.input_size
+        with torch.no_grad():
+            for name, param in self.rnn.named_parameters():
+                p1, p2 = getattr(rnn1, name), getattr(rnn2, name)
+                param.zero_()
+                for g in range(3):  # r, z, n gates
+                    rows = slice(g*2*H, g*2*H + H), slice(g*2*H + H, (g+1)*2*H)
+                    if name.startswith('weight_ih'):
+                        param[rows[0], :I] = p1[g*H:(g+1)*H]
+                        param[rows[1], I:] = p2[g*H:(g+1)*H]
+                    elif name.startswith('weight_hh'):
+                        param[rows[0], :H] = p1[g*H:(g+1)*H]
+                        param[rows[1], H:] = p2[g*H:(g+1)*H]
+                    else:
+                        param[rows[0]] = p1[g*H:(g+1)*H]
+                        param[rows[1]] = p2[g*H:(g+1)*H]
+
+    def forward(self, x, h=None):
+        """
+        x: (B, seq_length, input_size)
+        h: (num_layers, B, hidden_size), same layout as GRNN
+        """
+        y, h = self.rnn(x, h)
+        if self.bidirectional:
+            # (fwd1, fwd2, bwd1, bwd2) -> GRNN order (fwd1, bwd1, fwd2, bwd2)
+            H = self.rnn.hidden_size // 2
+            y = y.reshape(*y.shape[:-1], 2, 2, H).transpose(-3, -2).reshape(y.shape)
+        return y, h
+
+
 class DPGRNN(nn.Module):
     """Grouped Dual-path RNN"""
 
@@ -335,7 +427,9 @@ class GTCRN(nn.Module):
         feat = torch.stack([spec_mag, spec_real, spec_imag],
                            dim=1)  # (B,3,T,257)
 
-        feat = self.erb.bm(feat)  # (B,3,T,129)
+        # the network runs in the dtype of its weights (e.g. bfloat16, read from the encoder convs, which are never
+        # quantized), features and mask stay in spec.dtype
+        feat = self.erb.bm(feat.to(next(self.encoder.parameters()).dtype))  # (B,3,T,129)
         feat = self.sfe(feat)     # (B,9,T,129)
 
         feat, en_outs = self.encoder(feat)
@@ -345,13 +439,29 @@ class GTCRN(nn.Module):
 
         m_feat = self.decoder(feat, en_outs)
 
-        m = self.erb.bs(m_feat)
+        m = self.erb.bs(m_feat).to(spec.dtype)
 
         spec_enh = self.mask(m, spec_ref.permute(0, 3, 2, 1))  # (B,2,T,F)
         spec_enh = spec_enh.permute(0, 3, 2, 1)  # (B,F,T,2)
 
         return spec_enh
 
+    @torch.no_grad()
+    def fuse_for_inference(self):
+        """
+        Fold every BatchNorm2d into its conv, rewrite the stride-1
+        ConvTranspose2d layers as Conv2d and replace the GRNNs by FusedGRNNs.
+        In place, call after load_state_dict; the fused model no longer loads
+        the original checkpoints.
+        """
+        assert not self.training, "fuse_for_inference needs an eval-mode model"
+        for block in list(self.encoder.en_convs) + list(self.decoder.de_convs):
+            block.fuse()
+        for dpgrnn in [self.dpgrnn1, self.dpgrnn2]:
+            dpgrnn.intra_rnn = FusedGRNN(dpgrnn.intra_rnn)
+            dpgrnn.inter_rnn = FusedGRNN(dpgrnn.inter_rnn)
+        return self
+
 
 if __name__ == "__main__":
     model = GTCRN().eval()
@@ -384,3 +494,11 @@ if __name__ == "__main__":
 
     print((y1[:16000-256*2] - y2[:16000-256*2]).abs().max())
     print((y1[16000:] - y2[16000:]).abs().max())
+
+    """fusion check"""
+    x = torch.randn(1, 257, 63, 2)
+    fused = GTCRN().eval()
+    fused.load_state_dict(model.state_dict())
+    fused.fuse_for_inference()
+    with torch.no_grad():
+        print((model(x) - fused(x)).abs().max())
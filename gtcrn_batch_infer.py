@@ -1,55 +1,107 @@
 import os
+import time
 import torch
-import soundfile as sf
 from tqdm import tqdm
-from gtcrn import GTCRN
+from gtcrn_enhancer import GTCRNEnhancer, GTCRNMultiEnhancer, DTYPES
+from manifest import list_files
 import argparse
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
-parser = argparse.ArgumentParser(description="Enhance audio files using GTCRN model")
-parser.add_argument("--ckpt_path", type=str, required=True, help="Path to the checkpoint file")
-parser.add_argument("--input_folder", type=str, required=True, help="Path to the input folder containing noisy wav files")
-parser.add_argument("--output_folder", type=str, required=True, help="Path to the output folder to save enhanced wav files")
-args = parser.parse_args()
+'''
+python gtcrn_batch_infer.py --ckpt_path gtcrn_checkpoints/model_trained_on_dns3.tar --input_folder wav/noisy --output_folder wav/gtcrn_enh
+python gtcrn_batch_infer.py --ckpt_path gtcrn_checkpoints/model_trained_on_dns3.tar --input_folder wav/noisy --output_folder wav/gtcrn_enh --batch_size 16
+python gtcrn_batch_infer.py --ckpt_path gtcrn_checkpoints/model_trained_on_dns3.tar --input_folder wav/noisy --output_folder wav/gtcrn_enh --workers 8 --threads_per_worker 4
+python gtcrn_batch_infer.py --ckpt_path gtcrn_checkpoints/model_trained_on_dns3.tar --input_folder wav/noisy --output_folder wav/gtcrn_enh --batch_size 16 --dtype bf16
+python gtcrn_batch_infer.py --ckpt_path gtcrn_checkpoints/model_trained_on_dns3.tar --input_folder captures_48k --output_folder captures_48k_enh --keep_rate
+python gtcrn_batch_infer.py --ckpt_path gtcrn_checkpoints/model_trained_on_dns3.tar --input_folder wav/noisy --output_folder wav/gtcrn_enh --manifest wav_manifest.tsv
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-print(f'Using device: {device}')
-model = GTCRN().eval().to(device)
+several checkpoints in one pass (one decode + STFT per file), outputs in wav/gtcrn_enh/<checkpoint name>/ and wav/gtcrn_enh/ensemble/:
+python gtcrn_batch_infer.py --ckpt_path gtcrn_checkpoints/model_trained_on_dns3.tar gtcrn_checkpoints/model_trained_on_vctk.tar --input_folder wav/noisy --output_folder wav/gtcrn_enh --ensemble
+'''
 
-ckpt = torch.load(args.ckpt_path, map_location=device)
-model.load_state_dict(ckpt['model'])
+def make_enhancer(args, device):
+    if len(args.ckpt_path) > 1:
+        return GTCRNMultiEnhancer(args.ckpt_path, device, args.fuse, args.quantize, args.ensemble, args.dtype)
+    return GTCRNEnhancer(args.ckpt_path[0], device, args.fuse, args.quantize, args.dtype)
 
-input_folder = Path(args.input_folder)
-output_folder = Path(args.output_folder)
-output_folder.mkdir(parents=True, exist_ok=True)
+def report_parity(args, device, paths):
+    """Reduced-precision output against float32 on a few files, before the run"""
+    for ckpt_path in args.ckpt_path:
+        enhancer = GTCRNEnhancer(ckpt_path, device, args.fuse, dtype=args.dtype)
+        report = enhancer.parity_report(enhancer.read_files(paths)[0])
+        print(f"{os.path.basename(ckpt_path)}: {args.dtype} vs fp32 on {len(paths)} files: max abs error {report['max_abs_err']:.2e}, "
+              f"SI-SNR mean {report['si_snr_db_mean']:.2f} dB, min {report['si_snr_db_min']:.2f} dB")
 
-wav_files = [f for f in os.listdir(input_folder) if f.endswith('.wav')]
+# per-process state of the --workers pool
+_worker = {}
 
-def process_file(filename):
-    try:
-        input_path = input_folder / filename
-        output_path = output_folder / filename
+def init_worker(args, threads_per_worker):
+    torch.set_num_threads(threads_per_worker)
+    _worker['enhancer'] = make_enhancer(args, 'cpu')
+    _worker['args'] = args
 
-        mix, fs = sf.read(input_path, dtype='float32')
-        assert fs == 16000, f"Sample rate mismatch: {fs} Hz (Expected: 16000 Hz)"
+def run_worker(buckets):
+    args = _worker['args']
+    return sum(map(len, buckets)), _worker['enhancer'].enhance_buckets(buckets, args.output_folder, args.keep_rate, args.input_folder)
 
-        input = torch.from_numpy(mix).to(device).contiguous()
-        input = torch.stft(input, n_fft=512, hop_length=256, win_length=512, window=torch.hann_window(512, device=device), return_complex=True)
-        input = torch.view_as_real(input).contiguous().unsqueeze(0)
+def main():
+    parser = argparse.ArgumentParser(description="Enhance audio files using GTCRN model")
+    parser.add_argument("--ckpt_path", type=str, nargs='+', required=True, help="Path to the checkpoint file, several share one decode + STFT per file")
+    parser.add_argument("--ensemble", action='store_true', help="With several checkpoints, also write the averaged-mask output to <output_folder>/ensemble")
+    parser.add_argument("--input_folder", type=str, required=True, help="Path to the input folder containing noisy wav files")
+    parser.add_argument("--output_folder", type=str, required=True, help="Path to the output folder to save enhanced wav files")
+    parser.add_argument("--keep_rate", action='store_true', help="Inputs of any rate are resampled to 16kHz in memory, write outputs back at the input rate")
+    parser.add_argument("--fuse", action='store_true', help="Fold BatchNorm into the convs before inference (GTCRN.fuse_for_inference)")
+    parser.add_argument("--quantize", action='store_true', help="Dynamic int8 quantization of the GRU/Linear layers (CPU only)")
+    parser.add_argument("--dtype", type=str, default='fp32', choices=list(DTYPES), help="Network precision, STFT/iSTFT and mask stay float32 (default: fp32)")
+    parser.add_argument("--parity_files", type=int, default=4, help="With --dtype other than fp32, files checked against float32 first (default: 4)")
+    parser.add_argument("--batch_size", type=int, default=1, help="Files per padded forward pass, grouped by length (default: 1, one forward per file)")
+    parser.add_argument("--workers", type=int, default=0, help="Number of worker processes, each with its own model on CPU (default: 0, in-process thread pool)")
+    parser.add_argument("--threads_per_worker", type=int, default=1, help="torch intra-op threads per worker process (default: 1)")
+    parser.add_argument("--chunk_size", type=int, default=32, help="Files handed to a worker at a time, rounded to whole --batch_size buckets (default: 32)")
+    parser.add_argument("--manifest", type=str, nargs='+', default=None, help="Manifest(s) from manifest.py to look the input files up in instead of listing the folder")
+    args = parser.parse_args()
 
-        with torch.no_grad():
-            output = model(input)[0]
-            output = output.contiguous()
-            output = torch.view_as_complex(output).contiguous()
+    Path(args.output_folder).mkdir(parents=True, exist_ok=True)
 
-            enh = torch.istft(output, n_fft=512, hop_length=256, win_length=512, window=torch.hann_window(512, device=device))
+    wav_files = list_files(args.input_folder, args.manifest)
 
-        sf.write(output_path, enh.cpu().numpy(), fs)
-    except Exception as e:
-        print(f"Error processing {filename}: {e}")
+    if args.dtype != 'fp32' and args.parity_files > 0:
+        report_parity(args, 'cpu' if args.workers > 0 or not torch.cuda.is_available() else 'cuda', wav_files[:args.parity_files])
 
-with ThreadPoolExecutor() as executor:
-    list(tqdm(executor.map(process_file, wav_files), total=len(wav_files), desc="Processing files"))
+    tic = time.perf_counter()
+    duration = 0.
+    if args.workers > 0:
+        print(f'Using {args.workers} worker processes x {args.threads_per_worker} threads on cpu')
+        # length buckets over all files, cut in the parent so a worker's batches are not padded across a chunk
+        buckets = GTCRNEnhancer.make_buckets(wav_files, args.batch_size) if args.batch_size > 1 else [[f] for f in wav_files]
+        per_chunk = max(1, args.chunk_size // args.batch_size)
+        chunks = [buckets[i:i + per_chunk] for i in range(0, len(buckets), per_chunk)]
+        with ProcessPoolExecutor(args.workers, initializer=init_worker,
+                                 initargs=(args, args.threads_per_worker)) as executor:
+            with tqdm(total=len(wav_files), desc="Processing files") as pbar:
+                for n_files, chunk_duration in executor.map(run_worker, chunks):
+                    duration += chunk_duration
+                    pbar.update(n_files)
+    else:
+        device = torch.device("cuda" if torch.cuda.is_available() and not args.quantize else "cpu")
+        print(f'Using device: {device}')
+        enhancer = make_enhancer(args, device)
+        if args.batch_size > 1:
+            buckets = enhancer.make_buckets(wav_files, args.batch_size)
+            for bucket in tqdm(buckets, desc="Processing buckets"):
+                duration += enhancer.enhance_buckets([bucket], args.output_folder, args.keep_rate, args.input_folder)
+        else:
+            with ThreadPoolExecutor() as executor:
+                durations = list(tqdm(executor.map(lambda f: enhancer.enhance_files([f], args.output_folder, keep_rate=args.keep_rate, in_dir=args.input_folder), wav_files),
+                                      total=len(wav_files), desc="Processing files"))
+            duration = sum(durations)
+    elapsed = time.perf_counter() - tic
 
-print("All files processed.")
+    print("All files processed.")
+    print(f"{len(wav_files)} files, {duration:.1f} s of audio in {elapsed:.1f} s: "
+          f"{len(wav_files) / elapsed:.2f} files/s, RTF {elapsed / max(duration, 1e-9):.4f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import numpy as np
+
+'''
+Convert a .tar training checkpoint to a memory-mappable .safetensors file (model weights only):
+python gtcrn_ckpt.py --ckpt_path gtcrn_checkpoints/model_trained_on_dns3.tar
+python gtcrn_ckpt.py --ckpt_path gtcrn_checkpoints/model_trained_on_dns3.tar --output gtcrn_checkpoints/dns3.safetensors
+
+every tool taking --ckpt_path accepts either file:
+python gtcrn_infer.py --ckpt_path gtcrn_checkpoints/model_trained_on_dns3.safetensors -i wav/noisy/p232_005.wav
+
+time-to-first-output of gtcrn_infer.py (fresh process per run), .tar against .safetensors:
+python gtcrn_ckpt.py --ckpt_path gtcrn_checkpoints/model_trained_on_dns3.tar --benchmark wav/noisy/p232_005.wav
+'''
+
+# safetensors layout: 8-byte little-endian header size, JSON header, raw little-endian tensor bytes
+DTYPES = {'F64': '<f8', 'F32': '<f4', 'F16': '<f2', 'I64': '<i8', 'I32': '<i4', 'I16': '<i2', 'I8': 'i1', 'U8': 'u1', 'BOOL': '?'}
+DTYPE_CODES = {np.dtype(v): k for k, v in DTYPES.items()}
+
+
+def save_safetensors(state_dict, path):
+    """state_dict: {name: tensor} -> path, readable by load_safetensors (and the safetensors package)"""
+    arrays = {name: t.detach().cpu().contiguous().numpy() for name, t in state_dict.items()}
+    header, offset = {}, 0
+    for name, array in arrays.items():
+        array = array.astype(array.dtype.newbyteorder('<'), copy=False)
+        arrays[name] = array
+        header[name] = {'dtype': DTYPE_CODES[array.dtype], 'shape': list(array.shape),
+                        'data_offsets': [offset, offset + array.nbytes]}
+        offset += array.nbytes
+    header = json.dumps(header, separators=(',', ':')).encode()
+    header += b' ' * (-len(header) % 8)  # keeps every tensor 8-byte aligned
+    with open(path, 'wb') as f:
+        f.write(len(header).to_bytes(8, 'little'))
+        f.write(header)
+        for array in arrays.values():
+            f.write(array.tobytes())
+
+
+def load_safetensors(path):
+    """
+    path -> {name: tensor}, views of one copy-on-write memory map of the file:
+    nothing is unpickled or copied, pages are read when a tensor is first touched.
+    """
+    import torch
+    with open(path, 'rb') as f:
+        header_size = int.from_bytes(f.read(8), 'little')
+        header = json.loads(f.read(header_size))
+    header.pop('__metadata__', None)
+    if not header:
+        return {}
+    buffer = np.memmap(path, dtype=np.uint8, mode='c', offset=8 + header_size)
+    state_dict = {}
+    for name, info in header.items():
+        start, end = info['data_offsets']
+        array = buffer[start:end].view(DTYPES[info['dtype']]).reshape(info['shape'])
+        state_dict[name] = torch.from_numpy(array)
+    return state_dict
+
+
+def load_checkpoint(path):
+    """GTCRN state dict from a .safetensors file (memory-mapped) or a .tar training checkpoint"""
+    if path.endswith('.safetensors'):
+        return load_safetensors(path)
+    import torch
+    return torch.load(path, map_location='cpu')['model']
+
+
+def load_gtcrn_weights(model, path):
+    """
+    Load path into model. Memory-mapped weights are assigned rather than copied,
+    so the parameters stay views of the file until something writes to them.
+    """
+    state_dict = load_checkpoint(path)
+    try:
+        model.load_state_dict(state_dict, assign=path.endswith('.safetensors'))
+    except TypeError:  # torch < 2.1, no assign: copied into the parameters
+        model.load_state_dict(state_dict)
+    return model
+
+
+def time_to_first_output(ckpt_path, wav_path, repeats):
+    """Wall time of a fresh `python gtcrn_infer.py` process, import to written WAV"""
+    out_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.startup_benchmark.wav')
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gtcrn_infer.py')
+    times = []
+    try:
+        for _ in range(repeats):
+            tic = time.perf_counter()
+            subprocess.run([sys.executable, script, '--ckpt_path', ckpt_path, '-i', wav_path, '-o', out_path],
+                           check=True, stdout=subprocess.DEVNULL)
+            times.append(time.perf_counter() - tic)
+    finally:
+        if os.path.exists(out_path):
+            os.remove(out_path)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a GTCRN .tar checkpoint to a memory-mappable .safetensors file")
+    parser.add_argument("--ckpt_path", type=str, required=True, help="Path to the .tar checkpoint file")
+    parser.add_argument('--output', '-o', type=str, default=None, help="Output path (default: ckpt_path with .safetensors suffix)")
+    parser.add_argument("--benchmark", type=str, default=None, metavar='WAV', help="Also time gtcrn_infer.py on this WAV with both checkpoints")
+    parser.add_argument("--repeats", type=int, default=5, help="Processes per checkpoint for --benchmark (default: 5)")
+    args = parser.parse_args()
+
+    import torch
+    output = args.output if args.output else os.path.splitext(args.ckpt_path)[0] + '.safetensors'
+    state_dict = torch.load(args.ckpt_path, map_location='cpu')['model']
+    save_safetensors(state_dict, output)
+    loaded = load_safetensors(output)
+    assert all(torch.equal(state_dict[k], loaded[k]) for k in state_dict), "Round trip mismatch"
+    print(f"{len(state_dict)} tensors, {os.path.getsize(args.ckpt_path)} -> {os.path.getsize(output)} bytes, saved to: {output}")
+
+    if args.benchmark:
+        for path in [args.ckpt_path, output]:
+            times = time_to_first_output(path, args.benchmark, args.repeats)
+            print(f"{os.path.basename(path):40s} time-to-first-output: mean {np.mean(times) * 1000:.0f} ms, min {np.min(times) * 1000:.0f} ms")
+
+if __name__ == "__main__":
+    main()
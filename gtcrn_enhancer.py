@@ -0,0 +1,210 @@
+import os
+import numpy as np
+import torch
+import soundfile as sf
+from gtcrn import GTCRN
+from gtcrn_ckpt import load_gtcrn_weights
+from resampler import resample
+
+'''
+from gtcrn_enhancer import GTCRNEnhancer
+enhancer = GTCRNEnhancer('gtcrn_checkpoints/model_trained_on_dns3.tar')
+enh = enhancer.enhance(mix)                                    # np.ndarray (L,) at 16kHz
+enhs = enhancer.enhance_batch([mix1, mix2])                    # one padded forward
+enhancer.enhance_files(['wav/noisy/p232_001.wav'], 'wav/gtcrn_enh', batch_size=16)
+enhancer.enhance_files(['capture_48k.wav'], 'enh', keep_rate=True)  # any input rate, resampled in memory, written back at 48kHz
+
+network in bfloat16 (STFT/iSTFT and the complex mask stay float32), checked against float32:
+enhancer = GTCRNEnhancer('gtcrn_checkpoints/model_trained_on_dns3.tar', dtype='bf16')
+enhancer.parity_report([mix])                                  # {'max_abs_err': ..., 'si_snr_db_mean': ..., 'si_snr_db_min': ...}
+
+several checkpoints sharing one decode + STFT, written to wav/gtcrn_enh/<checkpoint name>/:
+enhancer = GTCRNMultiEnhancer(['gtcrn_checkpoints/model_trained_on_dns3.tar', 'gtcrn_checkpoints/model_trained_on_vctk.tar'], ensemble=True)
+'''
+
+DTYPES = {'fp32': torch.float32, 'bf16': torch.bfloat16, 'fp16': torch.float16}
+
+
+class GTCRNEnhancer:
+    """GTCRN loaded once, with the STFT windows cached per device"""
+
+    n_fft = 512
+    hop_length = 256
+    sample_rate = 16000
+
+    def __init__(self, ckpt_path, device='cpu', fuse=False, quantize=False, dtype='fp32'):
+        assert not (quantize and dtype != 'fp32'), "Dynamic int8 quantization needs dtype='fp32'"
+        self.device = torch.device(device)
+        self.ckpt_path, self.fuse, self.dtype = ckpt_path, fuse, dtype
+        model = GTCRN().eval()
+        load_gtcrn_weights(model, ckpt_path)
+        if fuse:
+            model.fuse_for_inference()
+        if quantize:
+            assert self.device.type == 'cpu', "Dynamic int8 quantization runs on CPU only"
+            from gtcrn_quant import quantize_gtcrn
+            model = quantize_gtcrn(model)
+        self.model = model.to(self.device, DTYPES[dtype])
+        self._windows = {}
+
+    def window(self, device=None):
+        """sqrt-Hann analysis/synthesis window, built once per device"""
+        device = torch.device(device) if device is not None else self.device
+        if device not in self._windows:
+            self._windows[device] = torch.hann_window(self.n_fft, device=device).pow(0.5)
+        return self._windows[device]
+
+    def stft(self, mix):
+        """mix: (L,) tensor -> (F, T, 2)"""
+        spec = torch.stft(mix, self.n_fft, self.hop_length, self.n_fft, self.window(mix.device), return_complex=True)
+        return torch.view_as_real(spec)
+
+    def istft(self, spec, length=None):
+        """spec: (F, T, 2) -> (length,), by default (hop_length*(T-1),)"""
+        spec = torch.view_as_complex(spec.contiguous())
+        return torch.istft(spec, self.n_fft, self.hop_length, self.n_fft, self.window(spec.device), length=length)
+
+    @torch.no_grad()
+    def enhance_spec(self, spec):
+        """spec: (B, F, T, 2) -> (B, F, T, 2)"""
+        return self.model(spec.to(self.device))
+
+    def enhance(self, mix, fs=16000):
+        """mix: np.ndarray (L,) at fs -> enhanced np.ndarray at 16kHz, as many samples as mix has at 16kHz"""
+        mix = resample(mix, fs, self.sample_rate)
+        spec = self.stft(torch.as_tensor(mix, dtype=torch.float32, device=self.device))
+        return self.istft(self.enhance_spec(spec[None])[0], len(mix)).cpu().numpy()
+
+    def pad_specs(self, mixes):
+        """
+        mixes: list of np.ndarray (L_i,) -> zero-padded (B, F, T_max, 2) and the frame counts.
+        GTCRN is causal, so zero frames appended at the end leave the valid frames untouched.
+        """
+        specs = [self.stft(torch.as_tensor(mix, dtype=torch.float32, device=self.device)) for mix in mixes]
+        n_frames = [spec.shape[1] for spec in specs]
+        input = torch.zeros(len(specs), self.n_fft // 2 + 1, max(n_frames), 2, device=self.device)
+        for i, spec in enumerate(specs):
+            input[i, :, :n_frames[i]] = spec
+        return input, n_frames
+
+    def unpad_istft(self, output, n_frames, lengths=None):
+        """output: (B, F, T_max, 2) -> list of np.ndarray, each trimmed to its own frame count (and length)"""
+        lengths = lengths or [None] * len(n_frames)
+        return [self.istft(output[i, :, :n], length).cpu().numpy() for i, (n, length) in enumerate(zip(n_frames, lengths))]
+
+    def enhance_batch(self, mixes):
+        """mixes: list of np.ndarray (L_i,), enhanced with a single padded forward, each back to L_i samples"""
+        input, n_frames = self.pad_specs(mixes)
+        return self.unpad_istft(self.enhance_spec(input), n_frames, [len(mix) for mix in mixes])
+
+    def parity_report(self, mixes):
+        """Max abs error and SI-SNR (dB) of this enhancer's waveforms against a float32 GTCRNEnhancer of the same checkpoint"""
+        from batch_si_sdr import si_sdr
+        reference = GTCRNEnhancer(self.ckpt_path, self.device, self.fuse)
+        errors, snrs = [], []
+        for mix in mixes:
+            enh, ref = self.enhance(mix), reference.enhance(mix)
+            errors.append(np.abs(enh - ref).max())
+            snrs.append(si_sdr(enh.astype(np.float64), ref.astype(np.float64), zero_mean=True))
+        return {'max_abs_err': float(max(errors)), 'si_snr_db_mean': float(np.mean(snrs)), 'si_snr_db_min': float(min(snrs))}
+
+    def read_files(self, paths):
+        """paths -> list of np.ndarray resampled to 16kHz in memory, and the original sample rates"""
+        mixes, rates = [], []
+        for path in paths:
+            mix, fs = sf.read(path, dtype='float32')
+            mixes.append(resample(mix, fs, self.sample_rate))
+            rates.append(fs)
+        return mixes, rates
+
+    def write_files(self, paths, enhs, rates, out_dir, keep_rate=False, in_dir=None):
+        """
+        Write enhs under the paths relative to in_dir (sub-folders created), or their basenames without in_dir,
+        at 16kHz or (keep_rate) resampled back to the input rates
+        """
+        for path, enh, fs in zip(paths, enhs, rates):
+            fs = fs if keep_rate else self.sample_rate
+            out_path = os.path.join(out_dir, os.path.relpath(path, in_dir) if in_dir else os.path.basename(path))
+            os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+            sf.write(out_path, resample(enh, self.sample_rate, fs), fs)
+
+    @classmethod
+    def make_buckets(cls, paths, batch_size):
+        """Sort files by STFT frame count at 16kHz (from headers) and cut into buckets of batch_size, no model needed"""
+        infos = {p: sf.info(str(p)) for p in paths}
+        lengths = {p: info.frames * cls.sample_rate // info.samplerate // cls.hop_length + 1 for p, info in infos.items()}
+        paths = sorted(paths, key=lambda p: lengths[p])
+        return [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+
+    def enhance_files(self, paths, out_dir, batch_size=1, keep_rate=False, in_dir=None):
+        """
+        Enhance WAV files of any sample rate into out_dir (same basenames, or same paths relative to in_dir),
+        one by one or in length buckets.
+        keep_rate: write at each input's rate instead of 16kHz
+        returns: seconds of audio enhanced, failed files/buckets are reported and skipped
+        """
+        buckets = self.make_buckets(paths, batch_size) if batch_size > 1 else [[p] for p in paths]
+        return self.enhance_buckets(buckets, out_dir, keep_rate, in_dir)
+
+    def enhance_buckets(self, buckets, out_dir, keep_rate=False, in_dir=None):
+        """enhance_files on buckets already cut by make_buckets, one padded forward per bucket"""
+        os.makedirs(out_dir, exist_ok=True)
+        duration = 0.
+        for bucket in buckets:
+            try:
+                mixes, rates = self.read_files(bucket)
+                enhs = self.enhance_batch(mixes) if len(mixes) > 1 else [self.enhance(mixes[0])]
+                self.write_files(bucket, enhs, rates, out_dir, keep_rate, in_dir)
+                duration += sum(len(mix) for mix in mixes) / self.sample_rate
+            except Exception as e:
+                print(f"Error processing {bucket[0] if len(bucket) == 1 else f'bucket {bucket[0]} ... {bucket[-1]}'}: {e}")
+        return duration
+
+
+class GTCRNMultiEnhancer:
+    """
+    Several checkpoints run on one shared decode + STFT per file. Outputs go to
+    out_dir/<checkpoint name>/, and with ensemble=True the average of the
+    complex masks (equivalently of the enhanced spectra) to out_dir/ensemble/.
+    """
+
+    def __init__(self, ckpt_paths, device='cpu', fuse=False, quantize=False, ensemble=False, dtype='fp32'):
+        self.enhancers = [GTCRNEnhancer(p, device, fuse, quantize, dtype) for p in ckpt_paths]
+        self.names = [os.path.splitext(os.path.basename(p))[0] for p in ckpt_paths]
+        assert len(set(self.names)) == len(self.names), "Checkpoint file names must be distinct"
+        if ensemble:
+            self.names.append('ensemble')
+        self.ensemble = ensemble
+        # the STFT, bucketing and file reading only depend on the shared front end
+        self.front = self.enhancers[0]
+
+    def enhance_batch(self, mixes):
+        """mixes: list of np.ndarray (L_i,) -> {name: list of enhanced np.ndarray}"""
+        input, n_frames = self.front.pad_specs(mixes)
+        outputs = [enhancer.enhance_spec(input) for enhancer in self.enhancers]
+        if self.ensemble:
+            outputs.append(torch.stack(outputs).mean(0))
+        lengths = [len(mix) for mix in mixes]
+        return {name: self.front.unpad_istft(output, n_frames, lengths) for name, output in zip(self.names, outputs)}
+
+    def make_buckets(self, paths, batch_size):
+        return self.front.make_buckets(paths, batch_size)
+
+    def enhance_files(self, paths, out_dir, batch_size=1, keep_rate=False, in_dir=None):
+        """Same as GTCRNEnhancer.enhance_files, one sub-folder of out_dir per checkpoint"""
+        buckets = self.make_buckets(paths, batch_size) if batch_size > 1 else [[p] for p in paths]
+        return self.enhance_buckets(buckets, out_dir, keep_rate, in_dir)
+
+    def enhance_buckets(self, buckets, out_dir, keep_rate=False, in_dir=None):
+        for name in self.names:
+            os.makedirs(os.path.join(out_dir, name), exist_ok=True)
+        duration = 0.
+        for bucket in buckets:
+            try:
+                mixes, rates = self.front.read_files(bucket)
+                for name, enhs in self.enhance_batch(mixes).items():
+                    self.front.write_files(bucket, enhs, rates, os.path.join(out_dir, name), keep_rate, in_dir)
+                duration += sum(len(mix) for mix in mixes) / self.front.sample_rate
+            except Exception as e:
+                print(f"Error processing {bucket[0] if len(bucket) == 1 else f'bucket {bucket[0]} ... {bucket[-1]}'}: {e}")
+        return duration
@@ -2,43 +2,125 @@ import os
 import torch
 import soundfile as sf
 import argparse
-from gtcrn import GTCRN
+from gtcrn_enhancer import GTCRNEnhancer, DTYPES
+from resampler import resample
 
 '''
 python gtcrn_infer.py --ckpt_path gtcrn_checkpoints/model_trained_on_dns3.tar --input_wav  wav/noisy/p232_005.wav --output_wav wav/p232_005_enh.wav
 
 python enhance_wav.py --ckpt_path gtcrn_checkpoints/model_trained_on_vctk.tar --input_wav wav/noisy/p232_005.wav
+
+long recordings, read/enhanced/written in 10 s blocks with flat memory:
+python gtcrn_infer.py --ckpt_path gtcrn_checkpoints/model_trained_on_dns3.tar -i meeting.wav -o meeting_enh.wav --block_seconds 10
+
+any input rate (resampled to 16kHz in memory), --keep_rate writes the result back at the input rate:
+python gtcrn_infer.py --ckpt_path gtcrn_checkpoints/model_trained_on_dns3.tar -i capture_48k.wav -o capture_48k_enh.wav --keep_rate
+
+network in bfloat16, with max abs error / SI-SNR against float32 printed:
+python gtcrn_infer.py --ckpt_path gtcrn_checkpoints/model_trained_on_dns3.tar -i wav/noisy/p232_005.wav --dtype bf16
 '''
 
+def enhance_chunked(model, input_wav_path, output_wav_path, block_size):
+    """
+    Same output as the whole-file stft -> GTCRN -> istft, block by block.
+    model: StreamGTCRN, its caches carry the context across blocks.
+    block_size: samples per block, a multiple of the 256 hop, at least 512
+    """
+    n_fft, hop = 512, 256
+    window = torch.hann_window(n_fft).pow(0.5)
+    # window-square sum of two overlapping frames, what istft divides by
+    envelope = window[hop:].pow(2) + window[:hop].pow(2)
+    fs = sf.info(input_wav_path).samplerate
+    assert fs == 16000, "--block_seconds needs 16kHz input, use the whole-file mode for other rates"
+
+    model.reset()
+    buffer = torch.zeros(0)  # samples of the center-padded signal not yet framed
+    ola_tail = None          # second half of the last synthesized frame
+    is_first = True
+    blocks = sf.blocks(input_wav_path, blocksize=block_size, dtype='float32')
+    block = next(blocks, None)
+    with sf.SoundFile(output_wav_path, 'w', samplerate=fs, channels=1) as f_out:
+        while block is not None:
+            next_block = next(blocks, None)
+            x = torch.from_numpy(block)
+            if is_first:
+                # reflect padding of torch.stft(center=True)
+                x = torch.cat([x[1:n_fft//2+1].flip(0), x])
+                is_first = False
+            if next_block is None:
+                tail = torch.cat([buffer, x])
+                x = torch.cat([x, tail[-n_fft//2-1:-1].flip(0)])
+            buffer = torch.cat([buffer, x])
+            block = next_block
+
+            n_frames = (len(buffer) - n_fft) // hop + 1
+            if n_frames <= 0:
+                continue
+            frames = buffer.unfold(0, n_fft, hop)[:n_frames] * window  # (T,512)
+            buffer = buffer[n_frames * hop:]
+
+            spec = torch.view_as_real(torch.fft.rfft(frames, dim=-1).T)  # (257,T,2)
+            with torch.no_grad():
+                spec_enh = model.step(spec[None])[0]
+            frames = torch.fft.irfft(torch.view_as_complex(spec_enh.contiguous()), n=n_fft, dim=0).T * window
+
+            heads, tails = frames[:, :hop], frames[:, hop:]
+            if ola_tail is None:
+                # the head of frame 0 lies in the center padding that istft trims
+                out = heads[1:] + tails[:-1]
+            else:
+                out = heads + torch.cat([ola_tail[None], tails[:-1]])
+            ola_tail = tails[-1]
+            f_out.write((out / envelope).reshape(-1).numpy())
+
 def main():
     parser = argparse.ArgumentParser(description="Enhance noisy WAV file using GTCRN model")
     parser.add_argument("--ckpt_path", type=str, required=True, help="Path to the checkpoint file")
     parser.add_argument('--input_wav', '-i', type=str, required=True, help="Path to the noisy input WAV file")
     parser.add_argument('--output_wav', '-o', type=str, default=None, help="Path to save the enhanced output WAV file (optional)")
+    parser.add_argument("--block_seconds", type=float, default=None, help="Enhance in blocks of this many seconds with carried state, for long recordings")
+    parser.add_argument("--keep_rate", action='store_true', help="Write the output at the input sample rate instead of 16kHz")
+    parser.add_argument("--quantize", action='store_true', help="Dynamic int8 quantization of the GRU/Linear layers")
+    parser.add_argument("--dtype", type=str, default='fp32', choices=list(DTYPES), help="Network precision, STFT/iSTFT and mask stay float32 (default: fp32)")
     args = parser.parse_args()
 
     input_wav_path = args.input_wav
     output_wav_path = args.output_wav if args.output_wav else os.path.join('wav/gtcrn_enh', os.path.basename(input_wav_path))
 
+    assert not (args.quantize and args.dtype != 'fp32'), "--quantize needs --dtype fp32"
+
+    if args.block_seconds:
+        ## load model
+        from gtcrn_stream import StreamGTCRN
+        from gtcrn_ckpt import load_gtcrn_weights
+        model = load_gtcrn_weights(StreamGTCRN().eval(), args.ckpt_path)
+        if args.quantize:
+            from gtcrn_quant import quantize_gtcrn
+            model = quantize_gtcrn(model)
+        model.to(DTYPES[args.dtype])
+
+        ## chunked inference
+        block_size = max(2, round(args.block_seconds * 16000 / 256)) * 256
+        enhance_chunked(model, input_wav_path, output_wav_path, block_size)
+        print(f"Enhanced WAV saved to: {output_wav_path}")
+        return
+
     ## load model
-    device = torch.device("cpu")
-    model = GTCRN().eval()
-    ckpt_path = args.ckpt_path
-    ckpt = torch.load(ckpt_path, map_location=device)
-    model.load_state_dict(ckpt['model'])
+    enhancer = GTCRNEnhancer(args.ckpt_path, quantize=args.quantize, dtype=args.dtype)
 
     ## load data
     mix, fs = sf.read(input_wav_path, dtype='float32')
-    assert fs == 16000, "Sampling rate should be 16kHz"
+    mix = resample(mix, fs, 16000)
 
     ## inference
-    input = torch.stft(torch.from_numpy(mix), 512, 256, 512, torch.hann_window(512).pow(0.5), return_complex=False)
-    with torch.no_grad():
-        output = model(input[None])[0]
-    enh = torch.istft(output, 512, 256, 512, torch.hann_window(512).pow(0.5), return_complex=False)
+    enh = enhancer.enhance(mix)
+    if args.dtype != 'fp32':
+        report = enhancer.parity_report([mix])
+        print(f"{args.dtype} vs fp32: max abs error {report['max_abs_err']:.2e}, SI-SNR {report['si_snr_db_mean']:.2f} dB")
 
     ## save enhanced wav
-    sf.write(output_wav_path, enh.detach().cpu().numpy(), fs)
+    out_fs = fs if args.keep_rate else 16000
+    sf.write(output_wav_path, resample(enh, 16000, out_fs), out_fs)
     print(f"Enhanced WAV saved to: {output_wav_path}")
 
 if __name__ == "__main__":
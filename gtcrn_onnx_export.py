@@ -0,0 +1,61 @@
+import os
+import torch
+import argparse
+from gtcrn import GTCRN
+from gtcrn_stream import StreamGTCRN
+from gtcrn_ckpt import load_gtcrn_weights
+
+'''
+python gtcrn_onnx_export.py --ckpt_path gtcrn_checkpoints/model_trained_on_dns3.tar
+python gtcrn_onnx_export.py --ckpt_path gtcrn_checkpoints/model_trained_on_vctk.tar --output_dir gtcrn_onnx --stream
+'''
+
+def export_offline(model, output_path, opset):
+    """spec (B, 257, T, 2) -> spec_enh (B, 257, T, 2), dynamic batch and time axes"""
+    spec = torch.randn(1, 257, 63, 2)
+    # the TorchScript exporter keeps the time axis dynamic, the dynamo one bakes it into reshapes
+    torch.onnx.export(model, (spec,), output_path,
+                      input_names=['spec'], output_names=['spec_enh'],
+                      dynamic_axes={'spec': {0: 'batch', 2: 'frames'},
+                                    'spec_enh': {0: 'batch', 2: 'frames'}},
+                      opset_version=opset, do_constant_folding=True, dynamo=False)
+
+def export_stream(model, output_path, opset):
+    """spec (1, 257, 1, 2) + caches -> spec_enh (1, 257, 1, 2) + updated caches"""
+    spec = torch.randn(1, 257, 1, 2)
+    conv_cache, tra_cache, inter_cache = model.init_cache(batch_size=1)
+    torch.onnx.export(model, (spec, conv_cache, tra_cache, inter_cache), output_path,
+                      input_names=['spec', 'conv_cache', 'tra_cache', 'inter_cache'],
+                      output_names=['spec_enh', 'conv_cache_out', 'tra_cache_out', 'inter_cache_out'],
+                      opset_version=opset, do_constant_folding=True, dynamo=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a GTCRN checkpoint to ONNX")
+    parser.add_argument("--ckpt_path", type=str, required=True, help="Path to the checkpoint file")
+    parser.add_argument("--output_dir", type=str, default='gtcrn_onnx', help="Folder to save the ONNX graphs (default: gtcrn_onnx)")
+    parser.add_argument("--stream", action='store_true', help="Also export the frame-by-frame streaming graph")
+    parser.add_argument("--fuse", action='store_true', help="Fold BatchNorm and rewrite stride-1 deconvs before export")
+    parser.add_argument("--opset", type=int, default=14, help="ONNX opset version (default: 14)")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(args.ckpt_path))[0]
+
+    model = load_gtcrn_weights(GTCRN().eval(), args.ckpt_path)
+    if args.fuse:
+        model.fuse_for_inference()
+
+    output_path = os.path.join(args.output_dir, f"{name}.onnx")
+    export_offline(model, output_path, args.opset)
+    print(f"Offline graph saved to: {output_path}")
+
+    if args.stream:
+        stream_model = load_gtcrn_weights(StreamGTCRN().eval(), args.ckpt_path)
+        if args.fuse:
+            stream_model.fuse_for_inference()
+        output_path = os.path.join(args.output_dir, f"{name}_stream.onnx")
+        export_stream(stream_model, output_path, args.opset)
+        print(f"Streaming graph saved to: {output_path}")
+
+if __name__ == "__main__":
+    main()
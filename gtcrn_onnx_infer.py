@@ -0,0 +1,127 @@
+import os
+import time
+import argparse
+import numpy as np
+import soundfile as sf
+import onnxruntime as ort
+from tqdm import tqdm
+
+'''
+python gtcrn_onnx_infer.py --onnx_path gtcrn_onnx/model_trained_on_dns3.onnx -i wav/noisy -o wav/gtcrn_enh
+python gtcrn_onnx_infer.py --onnx_path gtcrn_onnx/model_trained_on_dns3_stream.onnx -i wav/noisy/p232_005.wav -o wav/gtcrn_enh --stream
+
+parity check against the torch model (needs torch):
+python gtcrn_onnx_infer.py --onnx_path gtcrn_onnx/model_trained_on_dns3.onnx --check_ckpt gtcrn_checkpoints/model_trained_on_dns3.tar
+'''
+
+N_FFT = 512
+HOP_LENGTH = 256
+# torch.hann_window(512).pow(0.5), as in gtcrn_infer.py
+WINDOW = np.sqrt(0.5 - 0.5 * np.cos(2 * np.pi * np.arange(N_FFT) / N_FFT)).astype(np.float32)
+
+
+def stft(x):
+    """x: (L,) -> (257, T, 2), same as torch.stft(center=True, pad_mode='reflect')"""
+    x = np.pad(x, (N_FFT // 2, N_FFT // 2), mode='reflect')
+    n_frames = 1 + (len(x) - N_FFT) // HOP_LENGTH
+    idx = np.arange(N_FFT)[None, :] + HOP_LENGTH * np.arange(n_frames)[:, None]
+    spec = np.fft.rfft(x[idx] * WINDOW, axis=-1).T  # (257, T)
+    return np.stack([spec.real, spec.imag], axis=-1).astype(np.float32)
+
+
+def istft(spec, length=None):
+    """spec: (257, T, 2) -> (length,), by default (HOP_LENGTH*(T-1),), same as torch.istft"""
+    frames = np.fft.irfft(spec[..., 0] + 1j * spec[..., 1], n=N_FFT, axis=0).T * WINDOW  # (T, 512)
+    n_frames = frames.shape[0]
+    out_len = N_FFT + HOP_LENGTH * (n_frames - 1)
+    y = np.zeros(out_len, dtype=np.float32)
+    envelope = np.zeros(out_len, dtype=np.float32)
+    for t in range(n_frames):
+        y[t * HOP_LENGTH:t * HOP_LENGTH + N_FFT] += frames[t]
+        envelope[t * HOP_LENGTH:t * HOP_LENGTH + N_FFT] += WINDOW ** 2
+    end = out_len - N_FFT // 2 if length is None else min(out_len, N_FFT // 2 + length)
+    y = y[N_FFT // 2:end] / np.maximum(envelope[N_FFT // 2:end], 1e-11)
+    if length is not None and len(y) < length:
+        y = np.pad(y, (0, length - len(y)))
+    return y
+
+
+class ORTEnhancer:
+    def __init__(self, onnx_path, intra_op_threads=1, stream=False):
+        options = ort.SessionOptions()
+        options.inter_op_num_threads = 1
+        options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+        self.stream = stream
+        if stream:
+            self.cache_shapes = {i.name: i.shape for i in self.session.get_inputs() if i.name != 'spec'}
+
+    def enhance_spec(self, spec):
+        """spec: (257, T, 2) -> (257, T, 2)"""
+        if not self.stream:
+            return self.session.run(None, {'spec': spec[None]})[0][0]
+
+        caches = {name: np.zeros(shape, dtype=np.float32) for name, shape in self.cache_shapes.items()}
+        outputs = []
+        for t in range(spec.shape[1]):
+            out, *new_caches = self.session.run(None, {'spec': spec[None, :, t:t+1], **caches})
+            caches = dict(zip(caches.keys(), new_caches))
+            outputs.append(out[0])
+        return np.concatenate(outputs, axis=1)
+
+    def __call__(self, mix):
+        return istft(self.enhance_spec(stft(mix)), len(mix))
+
+
+def check_parity(enhancer, ckpt_path, folder):
+    """Compare the ONNX Runtime output with the torch GTCRN on every wav file in folder"""
+    from gtcrn_enhancer import GTCRNEnhancer
+
+    reference = GTCRNEnhancer(ckpt_path)
+    for filename in sorted(f for f in os.listdir(folder) if f.endswith('.wav')):
+        mix, fs = sf.read(os.path.join(folder, filename), dtype='float32')
+        assert fs == 16000, "Sampling rate should be 16kHz"
+        enh_torch = reference.enhance(mix)
+        enh_ort = enhancer(mix)
+        print(f"{filename}: max abs error {np.abs(enh_torch - enh_ort).max():.3e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Enhance WAV files with a GTCRN ONNX graph through ONNX Runtime")
+    parser.add_argument("--onnx_path", type=str, required=True, help="Path to the ONNX graph exported by gtcrn_onnx_export.py")
+    parser.add_argument('--input', '-i', type=str, default=None, help="Noisy WAV file or folder")
+    parser.add_argument('--output', '-o', type=str, default='wav/gtcrn_enh', help="Folder to save the enhanced WAV files (default: wav/gtcrn_enh)")
+    parser.add_argument("--stream", action='store_true', help="The graph is the streaming one, run it frame by frame")
+    parser.add_argument("--intra_op_threads", type=int, default=1, help="ONNX Runtime intra-op threads (default: 1)")
+    parser.add_argument("--check_ckpt", type=str, default=None, help="Torch checkpoint to check parity against")
+    parser.add_argument("--check_folder", type=str, default='wav/noisy', help="Folder used for the parity check (default: wav/noisy)")
+    args = parser.parse_args()
+
+    enhancer = ORTEnhancer(args.onnx_path, args.intra_op_threads, args.stream)
+
+    if args.check_ckpt:
+        check_parity(enhancer, args.check_ckpt, args.check_folder)
+
+    if args.input is None:
+        return
+
+    if os.path.isdir(args.input):
+        wav_files = [os.path.join(args.input, f) for f in sorted(os.listdir(args.input)) if f.endswith('.wav')]
+    else:
+        wav_files = [args.input]
+    os.makedirs(args.output, exist_ok=True)
+
+    total_time, total_duration = 0., 0.
+    for wav_file in tqdm(wav_files, desc="Enhancing"):
+        mix, fs = sf.read(wav_file, dtype='float32')
+        assert fs == 16000, "Sampling rate should be 16kHz"
+        tic = time.perf_counter()
+        enh = enhancer(mix)
+        total_time += time.perf_counter() - tic
+        total_duration += len(mix) / fs
+        sf.write(os.path.join(args.output, os.path.basename(wav_file)), enh, fs)
+
+    print(f"Enhanced {len(wav_files)} files, RTF: {total_time / max(total_duration, 1e-9):.4f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import os
+import time
+import argparse
+import numpy as np
+import torch
+import torch.nn as nn
+import soundfile as sf
+
+'''
+compare the int8 model against the float one (speed, PESQ/STOI/SI-SNR):
+python gtcrn_quant.py --ckpt_path gtcrn_checkpoints/model_trained_on_dns3.tar --noisy_folder wav/noisy --clean_folder wav/clean
+'''
+
+def quantize_gtcrn(model, quantize_erb=False):
+    """
+    Dynamic int8 quantization of the GRUs (GRNN, TRA) and Linears (intra/inter fc, att_fc), CPU only.
+    The fixed ERB filterbanks (erb_fc/ierb_fc) cost most of the accuracy, so they stay float by default.
+    """
+    qconfig_spec = {name: torch.quantization.default_dynamic_qconfig
+                    for name, module in model.named_modules()
+                    if isinstance(module, (nn.GRU, nn.Linear)) and (quantize_erb or not name.startswith('erb.'))}
+    return torch.quantization.quantize_dynamic(model, qconfig_spec, dtype=torch.qint8)
+
+def compare(ckpt_path, noisy_folder, clean_folder, num_threads=1, quantize_erb=False):
+    # metric packages only for the comparison, quantize_gtcrn is imported by the inference tools
+    from pesq import pesq
+    from pystoi.stoi import stoi
+    from tqdm import tqdm
+    from batch_si_sdr import si_sdr
+    from gtcrn_enhancer import GTCRNEnhancer
+    torch.set_num_threads(num_threads)
+    enhancers = {'fp32': GTCRNEnhancer(ckpt_path), 'int8': GTCRNEnhancer(ckpt_path)}
+    enhancers['int8'].model = quantize_gtcrn(enhancers['int8'].model, quantize_erb)
+
+    times = {name: 0. for name in enhancers}
+    scores = {name: {'PESQ': [], 'STOI': [], 'SI-SNR': []} for name in enhancers}
+    for filename in tqdm(sorted(os.listdir(noisy_folder)), desc='Comparing fp32/int8'):
+        if not filename.endswith('.wav'):
+            continue
+        clean_path = os.path.join(clean_folder, filename)
+        if not os.path.exists(clean_path):
+            print(f"Clean file not found for: {filename}")
+            continue
+        mix, fs = sf.read(os.path.join(noisy_folder, filename), dtype='float32')
+        clean, _ = sf.read(clean_path, dtype='float32')
+        assert fs == 16000, "Sampling rate should be 16kHz"
+
+        for name, enhancer in enhancers.items():
+            tic = time.perf_counter()
+            enh = enhancer.enhance(mix)
+            times[name] += time.perf_counter() - tic
+
+            n = min(len(clean), len(enh))
+            scores[name]['PESQ'].append(pesq(fs, clean[:n], enh[:n], 'wb'))
+            scores[name]['STOI'].append(stoi(clean[:n], enh[:n], fs, extended=False))
+            scores[name]['SI-SNR'].append(si_sdr(enh[:n].astype(np.float64), clean[:n].astype(np.float64), zero_mean=True))
+
+    print(f"{'':8s}{'fp32':>10s}{'int8':>10s}{'delta':>10s}")
+    for metric in ['PESQ', 'STOI', 'SI-SNR']:
+        fp32 = np.mean(scores['fp32'][metric])
+        int8 = np.mean(scores['int8'][metric])
+        print(f"{metric:8s}{fp32:10.4f}{int8:10.4f}{int8 - fp32:+10.4f}")
+    print(f"{'time(s)':8s}{times['fp32']:10.3f}{times['int8']:10.3f}")
+    print(f"speedup: {times['fp32'] / times['int8']:.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare dynamic int8 GTCRN with the float model on a folder")
+    parser.add_argument("--ckpt_path", type=str, required=True, help="Path to the checkpoint file")
+    parser.add_argument('--noisy_folder', '-n', type=str, required=True, help="Path to the folder containing noisy WAV files")
+    parser.add_argument('--clean_folder', '-c', type=str, required=True, help="Path to the folder containing clean WAV files")
+    parser.add_argument("--num_threads", type=int, default=1, help="torch intra-op threads (default: 1)")
+    parser.add_argument("--quantize_erb", action='store_true', help="Also quantize the ERB filterbank Linears")
+    args = parser.parse_args()
+
+    compare(args.ckpt_path, args.noisy_folder, args.clean_folder, args.num_threads, args.quantize_erb)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import io
+import os
+import json
+import time
+import queue
+import stat
+import argparse
+import threading
+import collections
+import socketserver
+import numpy as np
+import torch
+import soundfile as sf
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from gtcrn_enhancer import GTCRNEnhancer
+from resampler import resample
+
+'''
+python gtcrn_server.py --ckpt_path gtcrn_checkpoints/model_trained_on_dns3.tar --port 8765
+python gtcrn_server.py --ckpt_path gtcrn_checkpoints/model_trained_on_dns3.tar --unix_socket /tmp/gtcrn.sock
+
+WAV in (mono, any sample rate), WAV out at the same rate:
+curl -s --data-binary @wav/noisy/p232_005.wav -H "Content-Type: audio/wav" localhost:8765/enhance -o enh.wav
+raw 16kHz mono PCM in, same format out (format: f32 or s16, little endian):
+curl -s --data-binary @noisy.f32 "localhost:8765/enhance?format=f32" -o enh.f32
+curl -s --unix-socket /tmp/gtcrn.sock http://localhost/stats
+'''
+
+PCM_FORMATS = {'f32': np.dtype('<f4'), 's16': np.dtype('<i2')}
+
+
+class MicroBatcher:
+    """
+    Collects concurrent requests into padded batches: a batch is closed when it
+    holds max_batch requests or when its first request has waited max_latency_ms.
+    """
+
+    def __init__(self, enhancer, max_batch=16, max_latency_ms=10.):
+        self.enhancer = enhancer
+        self.max_batch = max_batch
+        self.max_latency = max_latency_ms / 1000
+        self.queue = queue.Queue()
+        self.batch_sizes = collections.Counter()
+        self.latencies = collections.deque(maxlen=10000)  # seconds, request arrival -> result
+        self.lock = threading.Lock()
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def submit(self, mix):
+        """Blocks until mix (np.ndarray, 16kHz) is enhanced"""
+        item = {'mix': mix, 'arrival': time.perf_counter(), 'done': threading.Event()}
+        self.queue.put(item)
+        item['done'].wait()
+        if 'error' in item:
+            raise item['error']
+        return item['enh']
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        deadline = batch[0]['arrival'] + self.max_latency
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                batch.append(self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            try:
+                mixes = [item['mix'] for item in batch]
+                enhs = self.enhancer.enhance_batch(mixes) if len(mixes) > 1 else [self.enhancer.enhance(mixes[0])]
+                for item, enh in zip(batch, enhs):
+                    item['enh'] = enh
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0]['error'] = e
+                else:
+                    # one bad request must not fail the others batched with it
+                    for item in batch:
+                        try:
+                            item['enh'] = self.enhancer.enhance(item['mix'])
+                        except Exception as item_error:
+                            item['error'] = item_error
+            now = time.perf_counter()
+            with self.lock:
+                self.batch_sizes[len(batch)] += 1
+                self.latencies.extend(now - item['arrival'] for item in batch)
+            for item in batch:
+                item['done'].set()
+
+    def stats(self):
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000
+            histogram = dict(sorted(self.batch_sizes.items()))
+        return {
+            'queue_depth': self.queue.qsize(),
+            'batches': sum(histogram.values()),
+            'requests': sum(size * n for size, n in histogram.items()),
+            'batch_size_histogram': {str(size): n for size, n in histogram.items()},
+            'latency_ms': {
+                'p50': float(np.percentile(latencies, 50)) if len(latencies) else None,
+                'p99': float(np.percentile(latencies, 99)) if len(latencies) else None,
+            },
+        }
+
+
+class EnhanceHandler(BaseHTTPRequestHandler):
+    batcher = None
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self, code, body, content_type):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlparse(self.path).path != '/stats':
+            return self._reply(404, b'not found\n', 'text/plain')
+        self._reply(200, json.dumps(self.batcher.stats()).encode(), 'application/json')
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/enhance':
+            return self._reply(404, b'not found\n', 'text/plain')
+        payload = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            if self.headers.get('Content-Type', '') in ('audio/wav', 'audio/x-wav', 'audio/wave'):
+                mix, fs = sf.read(io.BytesIO(payload), dtype='float32')
+                assert mix.ndim == 1, "Only mono audio is supported"
+                mix = resample(mix, fs, 16000)
+                fmt = None
+            else:
+                fmt = parse_qs(url.query).get('format', ['f32'])[0]
+                assert fmt in PCM_FORMATS, f"Unknown PCM format: {fmt} (Expected: f32 or s16)"
+                mix = np.frombuffer(payload, dtype=PCM_FORMATS[fmt]).astype(np.float32)
+                if fmt == 's16':
+                    mix /= 32768
+            # the STFT reflect-pads n_fft // 2 samples on each side, which needs a longer input
+            min_len = self.batcher.enhancer.n_fft // 2 + 1
+            assert len(mix) >= min_len, f"Audio too short: {len(mix)} samples at 16kHz, at least {min_len} needed"
+        except Exception as e:
+            return self._reply(400, f"{e}\n".encode(), 'text/plain')
+
+        try:
+            enh = self.batcher.submit(mix)
+        except Exception as e:
+            return self._reply(500, f"{e}\n".encode(), 'text/plain')
+
+        if fmt is None:
+            buffer = io.BytesIO()
+            sf.write(buffer, resample(enh, 16000, fs), fs, format='WAV')
+            self._reply(200, buffer.getvalue(), 'audio/wav')
+        elif fmt == 's16':
+            self._reply(200, (np.clip(enh, -1, 1 - 1 / 32768) * 32768).astype('<i2').tobytes(), 'application/octet-stream')
+        else:
+            self._reply(200, enh.astype('<f4').tobytes(), 'application/octet-stream')
+
+    def address_string(self):
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local GTCRN enhancement service with dynamic micro-batching")
+    parser.add_argument("--ckpt_path", type=str, required=True, help="Path to the checkpoint file")
+    parser.add_argument("--port", type=int, default=8765, help="localhost HTTP port (default: 8765)")
+    parser.add_argument("--unix_socket", type=str, default=None, help="Serve on this Unix socket instead of localhost TCP")
+    parser.add_argument("--max_batch", type=int, default=16, help="Maximum requests per batch (default: 16)")
+    parser.add_argument("--max_latency_ms", type=float, default=10., help="Longest a request waits for its batch to fill (default: 10)")
+    parser.add_argument("--num_threads", type=int, default=1, help="torch intra-op threads (default: 1)")
+    parser.add_argument("--fuse", action='store_true', help="Fold BatchNorm into the convs before inference")
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.num_threads)
+    enhancer = GTCRNEnhancer(args.ckpt_path, fuse=args.fuse)
+    enhancer.enhance(np.zeros(16000, dtype=np.float32))  # warm up
+    EnhanceHandler.batcher = MicroBatcher(enhancer, args.max_batch, args.max_latency_ms)
+
+    if args.unix_socket:
+        if os.path.exists(args.unix_socket):
+            if not stat.S_ISSOCK(os.stat(args.unix_socket).st_mode):
+                raise SystemExit(f"{args.unix_socket} exists and is not a socket, not removing it")
+            os.remove(args.unix_socket)
+        server = ThreadingUnixHTTPServer(args.unix_socket, EnhanceHandler)
+        print(f"Serving on unix socket {args.unix_socket}")
+    else:
+        server = ThreadingHTTPServer(('127.0.0.1', args.port), EnhanceHandler)
+        print(f"Serving on http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.unix_socket and os.path.exists(args.unix_socket):
+            os.remove(args.unix_socket)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Streaming GTCRN: frame-by-frame inference with explicit caches.
+Shares the state dict of `GTCRN`, one STFT frame (hop 256 @ 16kHz) per call,
+or a chunk of T frames when the caches are carried across longer blocks.
+"""
+import torch
+from gtcrn import GTCRN, GTConvBlock
+
+
+def tra_step(tra, x, h):
+    """
+    x: (B,C,T,F)
+    h: (1,B,2C)
+    """
+    zt = torch.mean(x.pow(2), dim=-1)  # (B,C,T)
+    at, h = tra.att_gru(zt.transpose(1, 2), h)
+    at = tra.att_fc(at).transpose(1, 2)
+    at = tra.att_act(at)
+    At = at[..., None]  # (B,C,T,1)
+
+    return x * At, h
+
+
+def gtconv_step(block, x, conv_cache, tra_cache):
+    """
+    x: (B,C,T,F)
+    conv_cache: (B,H,pad_size,F), history of the depthwise conv input
+    tra_cache: (1,B,C)
+    """
+    x1, x2 = torch.chunk(x, chunks=2, dim=1)
+
+    x1 = block.sfe(x1)
+    h1 = block.point_act(block.point_bn1(block.point_conv1(x1)))
+    h1 = torch.cat([conv_cache, h1], dim=2)  # (B,H,pad_size+T,F)
+    conv_cache = h1[:, :, h1.shape[2]-block.pad_size:]
+    h1 = block.depth_act(block.depth_bn(block.depth_conv(h1)))
+    h1 = block.point_bn2(block.point_conv2(h1))
+
+    h1, tra_cache = tra_step(block.tra, h1, tra_cache)
+
+    x = block.shuffle(h1, x2)
+
+    return x, conv_cache, tra_cache
+
+
+def dpgrnn_step(block, x, inter_cache):
+    """
+    x: (B,C,T,F)
+    inter_cache: (1,B*F,C)
+    """
+    # Intra RNN
+    x = x.permute(0, 2, 3, 1)  # (B,T,F,C)
+    intra_x = x.reshape(x.shape[0] * x.shape[1],
+                        x.shape[2], x.shape[3])  # (B*T,F,C)
+    intra_x = block.intra_rnn(intra_x)[0]  # (B*T,F,C)
+    intra_x = block.intra_fc(intra_x)      # (B*T,F,C)
+    intra_x = intra_x.reshape(
+        x.shape[0], -1, block.width, block.hidden_size)  # (B,T,F,C)
+    intra_x = block.intra_ln(intra_x)
+    intra_out = torch.add(x, intra_x)
+
+    # Inter RNN
+    x = intra_out.permute(0, 2, 1, 3)  # (B,F,T,C)
+    inter_x = x.reshape(x.shape[0] * x.shape[1], x.shape[2], x.shape[3])
+    inter_x, inter_cache = block.inter_rnn(inter_x, inter_cache)  # (B*F,T,C)
+    inter_x = block.inter_fc(inter_x)      # (B*F,T,C)
+    inter_x = inter_x.reshape(
+        x.shape[0], block.width, -1, block.hidden_size)  # (B,F,T,C)
+    inter_x = inter_x.permute(0, 2, 1, 3)   # (B,T,F,C)
+    inter_x = block.inter_ln(inter_x)
+    inter_out = torch.add(intra_out, inter_x)
+
+    dual_out = inter_out.permute(0, 3, 1, 2)  # (B,C,T,F)
+
+    return dual_out, inter_cache
+
+
+def convs_step(convs, x, conv_cache, tra_cache, skips=None):
+    """
+    Run an encoder/decoder ModuleList on one frame (or a chunk of frames).
+    conv_cache: (B,H,sum(pad_size),F), tra_cache: (N_gt,1,B,C)
+    """
+    outs = []
+    conv_caches, tra_caches = [], []
+    offset = 0
+    N_layers = len(convs)
+    for i in range(N_layers):
+        if skips is not None:
+            x = x + skips[N_layers-1-i]
+        block = convs[i]
+        if isinstance(block, GTConvBlock):
+            cache = conv_cache[:, :, offset:offset+block.pad_size]
+            x, cache, h = gtconv_step(
+                block, x, cache, tra_cache[len(tra_caches)])
+            offset += block.pad_size
+            conv_caches.append(cache)
+            tra_caches.append(h)
+        else:
+            x = block(x)
+        outs.append(x)
+    return x, outs, torch.cat(conv_caches, dim=2), torch.stack(tra_caches)
+
+
+class StreamGTCRN(GTCRN):
+    """
+    Frame-by-frame GTCRN. `forward` is stateless (caches in, caches out) so it
+    can be traced/exported; `reset` + `step` keep the caches on the module.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.conv_cache = None
+        self.tra_cache = None
+        self.inter_cache = None
+
+    def init_cache(self, batch_size=1, device=None):
+        """
+        conv_cache: (2, B, H, sum(pad_size), F_erb)   [encoder, decoder]
+        tra_cache: (2, N_gt, 1, B, C_tra)
+        inter_cache: (2, 1, B*F_erb, C)               [dpgrnn1, dpgrnn2]
+        """
+        gt_blocks = [m for m in self.encoder.en_convs if isinstance(m, GTConvBlock)]
+        hidden = gt_blocks[0].depth_conv.in_channels
+        n_frames = sum(m.pad_size for m in gt_blocks)
+        tra_hidden = gt_blocks[0].tra.att_gru.hidden_size
+        width = self.dpgrnn1.width
+        dtype = next(self.encoder.parameters()).dtype  # the encoder convs are never quantized
+        conv_cache = torch.zeros(2, batch_size, hidden, n_frames, width, device=device, dtype=dtype)
+        tra_cache = torch.zeros(2, len(gt_blocks), 1, batch_size, tra_hidden, device=device, dtype=dtype)
+        inter_cache = torch.zeros(2, 1, batch_size*width,
+                                  self.dpgrnn1.inter_rnn.hidden_size, device=device, dtype=dtype)
+        return conv_cache, tra_cache, inter_cache
+
+    def reset(self, batch_size=1, device=None):
+        self.conv_cache, self.tra_cache, self.inter_cache = self.init_cache(batch_size, device)
+
+    def step(self, spec):
+        """
+        spec: (B, F, T, 2), uses and updates the caches held by the module
+        """
+        if self.conv_cache is None or self.conv_cache.shape[1] != spec.shape[0]:
+            self.reset(spec.shape[0], spec.device)
+        spec_enh, self.conv_cache, self.tra_cache, self.inter_cache = self.forward(
+            spec, self.conv_cache, self.tra_cache, self.inter_cache)
+        return spec_enh
+
+    def forward(self, spec, conv_cache, tra_cache, inter_cache):
+        """
+        spec: (B, F, T, 2), T=1 for frame-by-frame streaming
+        returns: spec_enh (B, F, T, 2) and the updated caches
+        """
+        spec_ref = spec  # (B,F,T,2)
+
+        spec_real = spec[..., 0].permute(0, 2, 1)
+        spec_imag = spec[..., 1].permute(0, 2, 1)
+        spec_mag = torch.sqrt(spec_real**2 + spec_imag**2 + 1e-12)
+        feat = torch.stack([spec_mag, spec_real, spec_imag],
+                           dim=1)  # (B,3,T,257)
+
+        feat = self.erb.bm(feat.to(next(self.encoder.parameters()).dtype))  # (B,3,T,129)
+        feat = self.sfe(feat)     # (B,9,T,129)
+
+        feat, en_outs, en_conv_cache, en_tra_cache = convs_step(
+            self.encoder.en_convs, feat, conv_cache[0], tra_cache[0])
+
+        feat, inter_cache1 = dpgrnn_step(self.dpgrnn1, feat, inter_cache[0])  # (B,16,T,33)
+        feat, inter_cache2 = dpgrnn_step(self.dpgrnn2, feat, inter_cache[1])  # (B,16,T,33)
+
+        m_feat, _, de_conv_cache, de_tra_cache = convs_step(
+            self.decoder.de_convs, feat, conv_cache[1], tra_cache[1], skips=en_outs)
+
+        m = self.erb.bs(m_feat).to(spec.dtype)
+
+        spec_enh = self.mask(m, spec_ref.permute(0, 3, 2, 1))  # (B,2,T,F)
+        spec_enh = spec_enh.permute(0, 3, 2, 1)  # (B,F,T,2)
+
+        conv_cache = torch.stack([en_conv_cache, de_conv_cache])
+        tra_cache = torch.stack([en_tra_cache, de_tra_cache])
+        inter_cache = torch.stack([inter_cache1, inter_cache2])
+
+        return spec_enh, conv_cache, tra_cache, inter_cache
+
+
+if __name__ == "__main__":
+    import time
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check streaming GTCRN against offline inference")
+    parser.add_argument("--ckpt_path", type=str, default=None, help="Path to the checkpoint file (optional)")
+    parser.add_argument("--frames", type=int, default=63, help="Number of STFT frames to test")
+    args = parser.parse_args()
+
+    torch.set_num_threads(1)
+    model = GTCRN().eval()
+    stream_model = StreamGTCRN().eval()
+    if args.ckpt_path:
+        from gtcrn_ckpt import load_gtcrn_weights
+        load_gtcrn_weights(model, args.ckpt_path)
+    stream_model.load_state_dict(model.state_dict())
+
+    """offline vs. streaming"""
+    x = torch.randn(1, 257, args.frames, 2)
+    with torch.no_grad():
+        y_offline = model(x)
+
+        stream_model.reset()
+        ys = []
+        times = []
+        for i in range(x.shape[2]):
+            tic = time.perf_counter()
+            ys.append(stream_model.step(x[:, :, i:i+1]))
+            times.append(time.perf_counter() - tic)
+        y_stream = torch.cat(ys, dim=2)
+
+    print("max abs error:", (y_offline - y_stream).abs().max().item())
+    print(f"per-frame time: {1e3*sum(times)/len(times):.3f} ms (hop: 16 ms)")
@@ -0,0 +1,196 @@
+import os
+import argparse
+import functools
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from wav_io import wav_layout
+
+'''
+One os.scandir walk over a corpus, recording path, size, mtime, sample rate, channels and frames
+(read from the WAV header only) into a compact TSV index:
+python manifest.py wav -o wav_manifest.tsv
+python manifest.py /data/corpus -o corpus.tsv --recursive --jobs 16
+python manifest.py /data/corpus -o corpus.tsv --recursive --jobs 16 --update    # headers re-read only for changed files
+
+batch tools then look files up in the manifest instead of listing folders, clean/enhanced paired in memory:
+python calculate_metrics.py -c wav/clean -e wav/gtcrn_enh --manifest wav_manifest.tsv
+python evaluate_dnsmos.py -t wav/noisy --manifest wav_manifest.tsv
+
+pairing check on a temporary corpus:
+python manifest.py --check
+'''
+
+Entry = namedtuple('Entry', ['path', 'size', 'mtime_ns', 'sr', 'channels', 'frames'])
+COLUMNS = Entry._fields
+
+
+def audio_header(path, file_size):
+    """(sr, channels, frames) from the header, soundfile for what is not a plain WAV; Nones if unreadable"""
+    try:
+        layout = wav_layout(path, file_size)
+        if layout is not None:
+            return layout.sr, layout.channels, layout.frames
+        import soundfile as sf
+        info = sf.info(path)
+        return info.samplerate, info.channels, info.frames
+    except Exception:
+        return None, None, None
+
+
+def scan_dir(root, rel, exts, headers, previous):
+    """entries of the matching files directly in root/rel, and its subdirectories (relative to root)"""
+    entries, subdirs = [], []
+    with os.scandir(os.path.join(root, rel)) as it:
+        for item in it:
+            path = f"{rel}/{item.name}" if rel else item.name
+            if item.is_dir():
+                subdirs.append(path)
+            elif item.name.lower().endswith(exts):
+                st = item.stat()
+                old = previous.get(path)
+                if old is not None and old.size == st.st_size and old.mtime_ns == st.st_mtime_ns:
+                    entries.append(old)
+                    continue
+                header = audio_header(item.path, st.st_size) if headers else (None, None, None)
+                entries.append(Entry(path, st.st_size, st.st_mtime_ns, *header))
+    return entries, subdirs
+
+
+def scan(root, recursive=False, jobs=1, exts=('.wav',), headers=True, previous=None):
+    """
+    [Entry] of the files under root ending in exts (paths relative to root, '/'-separated, sorted).
+    Subdirectories are scanned in parallel by jobs threads. previous: {path: Entry} of an earlier
+    scan, whose headers are reused for files with the same size and mtime.
+    """
+    previous = previous or {}
+    exts = tuple(ext.lower() for ext in exts)
+    entries = []
+    with ThreadPoolExecutor(jobs) as executor:
+        futures = {executor.submit(scan_dir, root, '', exts, headers, previous)}
+        while futures:
+            done, futures = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                found, subdirs = future.result()
+                entries.extend(found)
+                if recursive:
+                    futures |= {executor.submit(scan_dir, root, d, exts, headers, previous) for d in subdirs}
+    return sorted(entries)
+
+
+def write_manifest(path, root, entries, recursive=False):
+    with open(path, 'w') as f:
+        f.write(f"#root\t{os.path.abspath(root)}" + ("\trecursive" if recursive else "") + "\n")
+        f.write('\t'.join(COLUMNS) + '\n')
+        for e in entries:
+            f.write('\t'.join('' if v is None else str(v) for v in e) + '\n')
+
+
+@functools.lru_cache(maxsize=None)
+def load_manifest(path):
+    """manifest file -> (absolute root, [Entry], recursive)"""
+    with open(path) as f:
+        header = f.readline().rstrip('\n').split('\t')
+        root, recursive = header[1], 'recursive' in header[2:]
+        f.readline()
+        entries = []
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            entries.append(Entry(fields[0], *(int(v) if v else None for v in fields[1:])))
+    # manifests written before the flag: nested paths mean a recursive scan
+    recursive = recursive or any('/' in e.path for e in entries)
+    return root, entries, recursive
+
+
+def index_folder(folder, manifests=None, ext='.wav'):
+    """
+    {path relative to folder: path} of the ext files in folder, from the manifests if given and one of them
+    covers folder (e.g. a fixed clean corpus next to freshly generated outputs), else one scandir,
+    recursive if any of the manifests is
+    """
+    covered, recursive = False, False
+    index = {}
+    for manifest in manifests or []:
+        root, entries, manifest_recursive = load_manifest(manifest)
+        recursive = recursive or manifest_recursive
+        absolute = os.path.abspath(folder)
+        if absolute == root:
+            prefix = ''
+        elif absolute.startswith(root + os.sep):
+            prefix = os.path.relpath(absolute, root).replace(os.sep, '/') + '/'
+        else:
+            continue
+        covered = True
+        for e in entries:
+            if e.path.startswith(prefix) and e.path.lower().endswith(ext):
+                index[e.path[len(prefix):]] = os.path.join(root, e.path)
+    if not covered:
+        index = {e.path: os.path.join(folder, e.path) for e in scan(folder, recursive, exts=(ext,), headers=False)}
+    return index
+
+
+def list_files(folder, manifests=None, ext='.wav'):
+    """sorted ext files in folder (recursively, if the manifest was)"""
+    index = index_folder(folder, manifests, ext)
+    return [index[name] for name in sorted(index)]
+
+
+def list_pairs(clean_folder, enhanced_folder, manifests=None, ext='.wav'):
+    """[(clean_path, enhanced_path)] joined on the path relative to each folder, sorted"""
+    clean = index_folder(clean_folder, manifests, ext)
+    enhanced = index_folder(enhanced_folder, manifests, ext)
+    pairs = []
+    for name in sorted(clean):
+        if name not in enhanced:
+            print(f"Enhanced file not found for: {clean[name]}")
+            continue
+        pairs.append((clean[name], enhanced[name]))
+    return pairs
+
+
+def check():
+    """list_pairs on a temporary corpus where only the clean folder has a manifest (flat or recursive)"""
+    import shutil
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp:
+        for folder in ['clean', 'enhanced']:
+            os.makedirs(os.path.join(tmp, folder, 'sub'))
+            for name in ['a.wav', 'sub/x.wav']:
+                shutil.copy('wav/clean/p232_001.wav', os.path.join(tmp, folder, name))
+        clean, enhanced = os.path.join(tmp, 'clean'), os.path.join(tmp, 'enhanced')
+        for recursive, expected in [(False, ['a.wav']), (True, ['a.wav', 'sub/x.wav'])]:
+            manifest = os.path.join(tmp, f'clean_{recursive}.tsv')
+            write_manifest(manifest, clean, scan(clean, recursive), recursive)
+            pairs = list_pairs(clean, enhanced, [manifest])
+            names = [os.path.relpath(e, enhanced).replace(os.sep, '/') for _, e in pairs]
+            assert names == expected, f"recursive={recursive}: {names}"
+            assert all(os.path.relpath(c, clean) == os.path.relpath(e, enhanced) for c, e in pairs)
+    print("check: folders without a manifest are paired flat and recursively as the clean manifest is")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a manifest (path, size, mtime, sr, channels, frames) of the audio files in a folder.")
+    parser.add_argument('root', type=str, nargs='?', help="Folder to index")
+    parser.add_argument('--output', '-o', type=str, help="Manifest TSV file to write")
+    parser.add_argument('--recursive', '-r', action='store_true', help="Descend into subdirectories")
+    parser.add_argument('--jobs', '-j', type=int, default=8, help="Threads scanning directories and reading headers (default: 8)")
+    parser.add_argument('--ext', type=str, nargs='+', default=['.wav'], help="File extensions to index (default: .wav)")
+    parser.add_argument('--update', action='store_true', help="Reuse the headers in an existing --output for unchanged files")
+    parser.add_argument('--check', action='store_true', help="Check the clean/enhanced pairing on a temporary corpus, then exit")
+    args = parser.parse_args()
+
+    if args.check:
+        check()
+        return
+    if args.root is None or args.output is None:
+        parser.error("root and --output are required")
+
+    previous = None
+    if args.update and os.path.exists(args.output):
+        previous = {e.path: e for e in load_manifest(args.output)[1]}
+    entries = scan(args.root, args.recursive, args.jobs, tuple(args.ext), previous=previous)
+    write_manifest(args.output, args.root, entries, args.recursive)
+    seconds = sum(e.frames / e.sr for e in entries if e.frames is not None and e.sr)
+    print(f"{len(entries)} files, {seconds / 3600:.2f} hours, manifest saved to: {args.output}")
+
+if __name__ == "__main__":
+    main()
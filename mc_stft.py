@@ -3,7 +3,8 @@
 # https://zhuanlan.zhihu.com/p/18860466841
 import math
 import torch
-import pytorch_lightning as pl
+import torch.nn as nn
+import torch.nn.functional as F
 from torch import Tensor
 
 
@@ -16,7 +17,8 @@ def get_trim_length(hop_length, min_trim=5000):
 
 
 def complex_norm(spec_complex, power=1.0):
-    return spec_complex.abs().pow(power)
+    mag = spec_complex.abs()
+    return mag if power == 1.0 else mag.pow(power)
 
 
 def complex_angle(spec_complex):
@@ -24,11 +26,11 @@ def complex_angle(spec_complex):
 
 
 def mag_phase_to_complex(mag, phase, power=1.0):
-    mag_power_1 = mag.pow(1 / power)
-    return mag_power_1 * torch.exp(1j * phase)
+    mag_power_1 = mag if power == 1.0 else mag.pow(1 / power)
+    return torch.polar(mag_power_1, phase)
 
 
-class STFT(pl.LightningModule):
+class STFT(nn.Module):
 
     def __init__(self, n_fft, hop_length):
         super().__init__()
@@ -89,7 +91,17 @@ class STFT(pl.LightningModule):
         return self.restore_complex(spec_complex)
 
 
-class multi_channeled_STFT(pl.LightningModule):
+class multi_channeled_STFT(nn.Module):
+    """
+    All channels in one STFT call: [B, C, T] is viewed as [B*C, T] and the result
+    viewed back as [B, C, ...], no per-channel loop, stack or copy. The iSTFT runs
+    on [B*C] row blocks whose (rows, n_fft, T') frame buffer stays within
+    istft_block_elements, past that the overlap-add falls out of cache and one
+    big call is slower than several.
+    """
+
+    istft_block_elements = 2 ** 21
+
     def __init__(self, n_fft, hop_length):
         super().__init__()
         self.n_fft = n_fft
@@ -105,58 +117,182 @@ class multi_channeled_STFT(pl.LightningModule):
         output: [B, C, F, T']  # complex dtype
         """
         B, C, T = input_signal.shape
-        specs = [self.stft.to_spec_complex(input_signal[:, ch]) for ch in range(C)]
-        return torch.stack(specs, dim=1)
+        spec = self.stft.to_spec_complex(input_signal.reshape(B * C, T))
+        return spec.view(B, C, *spec.shape[1:])
 
     def to_mag(self, input_signal, power=1.0):
         """
         input_signal: [B, C, T]
         output: [B, C, F, T']
         """
-        B, C, T = input_signal.shape
-        mags = [self.stft.to_mag(input_signal[:, ch], power) for ch in range(C)]
-        return torch.stack(mags, dim=1)
+        return complex_norm(self.to_spec_complex(input_signal), power)
 
     def to_phase(self, input_signal):
         """
         input_signal: [B, C, T]
         output: [B, C, F, T']
         """
-        B, C, T = input_signal.shape
-        phases = [self.stft.to_phase(input_signal[:, ch]) for ch in range(C)]
-        return torch.stack(phases, dim=1)
+        return complex_angle(self.to_spec_complex(input_signal))
 
     def to_mag_phase(self, input_signal, power=1.0):
         """
         input_signal: [B, C, T]
         output: (mag: [B, C, F, T'], phase: [B, C, F, T'])
         """
-        B, C, T = input_signal.shape
-        mags, phases = [], []
-        for ch in range(C):
-            mag, phase = self.stft.to_mag_phase(input_signal[:, ch], power)
-            mags.append(mag)
-            phases.append(phase)
-        return torch.stack(mags, dim=1), torch.stack(phases, dim=1)
+        spec_complex = self.to_spec_complex(input_signal)
+        return complex_norm(spec_complex, power), complex_angle(spec_complex)
 
     def restore_complex(self, spec_complex):
         """
         spec_complex: [B, C, F, T] (complex dtype)
         return: [B, C, T]
         """
-        B, C = spec_complex.shape[:2]
-        signals = [self.stft.restore_complex(spec_complex[:, ch]) for ch in range(C)]
-        return torch.stack(signals, dim=1)
+        B, C, F, T_ = spec_complex.shape
+        spec_complex = spec_complex.reshape(B * C, F, T_)
+        rows = max(1, self.istft_block_elements // (self.n_fft * T_))
+        if rows >= B * C:
+            signal = self.stft.restore_complex(spec_complex)
+        else:
+            signal = torch.cat([self.stft.restore_complex(block) for block in spec_complex.split(rows)])
+        return signal.view(B, C, -1)
 
     def restore_mag_phase(self, mag, phase, power=1.):
         """
         input_signal: mag, phase: [B, C, F, T']
         output: [B, C, T]
         """
-        B, C, F, T_ = mag.shape
-        signals = [self.stft.restore_mag_phase(mag[:, ch], phase[:, ch], power) for ch in range(C)]
-        return torch.stack(signals, dim=1)
-    
+        return self.restore_complex(mag_phase_to_complex(mag, phase, power))
+
+
+class StreamingSTFT(nn.Module):
+    """
+    Online analysis for [B, C] streams, same frames as STFT.to_spec_complex (center=True,
+    reflect padding) on the concatenated chunks. Carries the samples of the next,
+    incomplete frames (n_fft - hop plus < hop pending) and the last n_fft//2 + 1 input
+    samples for the closing reflection, so the state does not grow with the stream.
+
+    stft = StreamingSTFT(512, 128)
+    for chunk in chunks:          # [B, C, L], any L
+        spec = stft(chunk)        # [B, C, F, n], the n frames completed by chunk (n may be 0)
+    spec = stft.flush()           # frames of the reflection-padded end
+    """
+
+    def __init__(self, n_fft, hop_length):
+        super().__init__()
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.register_buffer("window", torch.hann_window(n_fft))
+        self.reset()
+
+    def reset(self):
+        self.buffer = None   # [B, C, samples not yet framed], padded signal
+        self.history = None  # [B, C, <= n_fft//2 + 1], last raw input samples
+        self.started = False
+
+    def _frames(self, buffer):
+        n_frames = max(0, (buffer.shape[-1] - self.n_fft) // self.hop_length + 1)
+        self.buffer = buffer[..., n_frames * self.hop_length:]
+        if n_frames == 0:
+            empty = buffer.new_zeros(*buffer.shape[:-1], self.n_fft // 2 + 1, 0)
+            return torch.complex(empty, empty)
+        frames = buffer.unfold(-1, self.n_fft, self.hop_length)[..., :n_frames, :]  # [B, C, n, n_fft]
+        spec = torch.fft.rfft(frames * self.window.to(buffer.device), dim=-1)
+        return spec.transpose(-1, -2)  # [B, C, F, n]
+
+    def forward(self, chunk):
+        """
+        chunk: [B, C, L]
+        output: [B, C, F, n]  # complex dtype
+        """
+        pad = self.n_fft // 2
+        if self.buffer is None:
+            self.buffer = self.history = chunk[..., :0]
+        self.history = torch.cat([self.history, chunk], dim=-1)[..., -(pad + 1):]
+        buffer = torch.cat([self.buffer, chunk], dim=-1)
+        if not self.started:
+            if buffer.shape[-1] <= pad:
+                return self._frames(buffer)
+            buffer = torch.cat([buffer[..., 1:pad + 1].flip(-1), buffer], dim=-1)
+            self.started = True
+        return self._frames(buffer)
+
+    def flush(self):
+        """Frames of the end of the stream, the reflection padding of torch.stft(center=True)"""
+        if not self.started:
+            raise ValueError(f"stream shorter than n_fft//2 + 1 = {self.n_fft // 2 + 1} samples")
+        pad = self.n_fft // 2
+        spec = self._frames(torch.cat([self.buffer, self.history[..., -pad - 1:-1].flip(-1)], dim=-1))
+        self.reset()
+        return spec
+
+
+class StreamingISTFT(nn.Module):
+    """
+    Online overlap-add synthesis matching STFT.restore_complex on the concatenated
+    frames: carries the n_fft - hop overlapping samples of the signal and of the
+    window-square envelope it is divided by. A sample is emitted as soon as the
+    last frame covering it has arrived, the first n_fft//2 (center padding) are trimmed.
+
+    istft = StreamingISTFT(512, 128)
+    for spec in specs:            # [B, C, F, n], any n
+        signal = istft(spec)      # [B, C, n * hop] (minus the trimmed start)
+    signal = istft.flush()        # [B, C, n_fft//2 - hop], what restore_complex still outputs
+    """
+
+    def __init__(self, n_fft, hop_length):
+        super().__init__()
+        assert hop_length <= n_fft // 2, "hop_length must be at most n_fft // 2"
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.register_buffer("window", torch.hann_window(n_fft))
+        self.reset()
+
+    def reset(self):
+        self.ola = None       # [B, C, n_fft - hop]
+        self.envelope = None  # [n_fft - hop]
+        self.to_trim = self.n_fft // 2
+
+    def _overlap_add(self, frames):
+        """frames: [N, n_fft, n] -> [N, (n - 1) * hop + n_fft]"""
+        length = (frames.shape[-1] - 1) * self.hop_length + self.n_fft
+        return F.fold(frames, (1, length), (1, self.n_fft), stride=(1, self.hop_length)).view(frames.shape[0], length)
+
+    def _emit(self, signal, envelope):
+        trim = min(self.to_trim, signal.shape[-1])
+        self.to_trim -= trim
+        return signal[..., trim:] / envelope[trim:]
+
+    def forward(self, spec_complex):
+        """
+        spec_complex: [B, C, F, n] (complex dtype)
+        return: [B, C, samples]
+        """
+        B, C, F_, n = spec_complex.shape
+        window = self.window.to(spec_complex.device)
+        overlap = self.n_fft - self.hop_length
+        if self.ola is None:
+            self.ola = window.new_zeros(B, C, overlap)
+            self.envelope = window.new_zeros(overlap)
+        if n == 0:
+            return self.ola[..., :0]
+
+        frames = torch.fft.irfft(spec_complex, n=self.n_fft, dim=-2) * window[:, None]  # [B, C, n_fft, n]
+        signal = self._overlap_add(frames.reshape(B * C, self.n_fft, n)).view(B, C, -1)
+        envelope = self._overlap_add(window.pow(2)[None, :, None].expand(1, self.n_fft, n))[0]
+        signal[..., :overlap] += self.ola
+        envelope[:overlap] += self.envelope
+
+        done = n * self.hop_length
+        self.ola, self.envelope = signal[..., done:], envelope[done:]
+        return self._emit(signal[..., :done], envelope[:done])
+
+    def flush(self):
+        """Samples up to the center of the last frame, where restore_complex stops"""
+        n_left = self.n_fft // 2 - self.hop_length
+        signal = self._emit(self.ola[..., :n_left], self.envelope[:n_left])
+        self.reset()
+        return signal
+
 
 if __name__ == "__main__":
     B, C, T = 16, 2, 16000
@@ -175,3 +311,23 @@ if __name__ == "__main__":
     print("Match original shape:", recon.shape == wav.shape) # Match original shape: True
     print("Exactly equal:", torch.equal(recon, wav)) # Exactly equal: False
     print("Allclose:", torch.allclose(recon, wav, atol=1e-5)) # Allclose: True
+
+    # streaming analysis/synthesis on random chunk sizes against the offline transforms
+    import time
+    stream_stft, stream_istft = StreamingSTFT(512, 128), StreamingISTFT(512, 128)
+    specs, signals, times = [], [], []
+    start = 0
+    while start < T:
+        size = int(torch.randint(1, 2000, (1,)))
+        tic = time.perf_counter()
+        specs.append(stream_stft(wav[..., start:start + size]))
+        signals.append(stream_istft(specs[-1]))
+        times.append(time.perf_counter() - tic)
+        start += size
+    specs.append(stream_stft.flush())
+    signals.append(stream_istft(specs[-1]))
+    signals.append(stream_istft.flush())
+    stream_spec, stream_recon = torch.cat(specs, dim=-1), torch.cat(signals, dim=-1)
+    print("Streaming STFT max error:", (stream_spec - spec).abs().max().item())
+    print("Streaming iSTFT max error:", (stream_recon - recon).abs().max().item())
+    print(f"Per-chunk latency: {sum(times) / len(times) * 1000:.3f} ms over {len(times)} chunks")
@@ -0,0 +1,211 @@
+import os
+import json
+import math
+import time
+import sqlite3
+import argparse
+from importlib import metadata
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+from wav_info_show import calculate_md5
+
+'''
+Content-addressed cache of metric results, a local SQLite file keyed by
+(metric, params, clean MD5, enhanced MD5): re-evaluating only scores new or changed files.
+python calculate_PESQ.py -c wav/clean -e wav/gtcrn_enh --cache metric_cache.sqlite
+python evaluate_dnsmos.py -t wav/gtcrn_enh --cache metric_cache.sqlite
+
+from metric_cache import MetricCache, cached_map
+with MetricCache('metric_cache.sqlite', max_mb=256) as cache:
+    results = cached_map(cache, 'pesq', 'mode=wb', pairs, score_pairs)
+
+cache summary / clearing:
+python metric_cache.py metric_cache.sqlite
+python metric_cache.py metric_cache.sqlite --clear
+'''
+
+
+def package_version(name):
+    """installed version of a package, part of the params so an upgrade invalidates its results"""
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+class MetricCache:
+    """
+    results: (metric, params, clean, enhanced) -> JSON value, clean is '' for no-reference metrics.
+    Rows past max_mb (None: no limit) are evicted least recently used first. File hashes are memoised by
+    (path, size, mtime) so an unchanged file is not read again; they count towards max_mb and are dropped
+    once no cached result refers to them.
+    """
+    def __init__(self, path, max_mb=256):
+        self.max_bytes = None if max_mb is None else int(max_mb * 2 ** 20)
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS results (metric TEXT, params TEXT, clean TEXT, enhanced TEXT, '
+                        'value TEXT, size INTEGER, last_used REAL, PRIMARY KEY (metric, params, clean, enhanced))')
+        self.db.execute('CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS hashes (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, md5 TEXT)')
+        self.db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.evict()
+        self.db.close()
+
+    def file_hash(self, path):
+        if path is None:
+            return ''
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        row = self.db.execute('SELECT md5 FROM hashes WHERE path = ? AND size = ? AND mtime_ns = ?',
+                              (path, st.st_size, st.st_mtime_ns)).fetchone()
+        if row is not None:
+            return row[0]
+        md5 = calculate_md5(path)
+        self.db.execute('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?)', (path, st.st_size, st.st_mtime_ns, md5))
+        return md5
+
+    def get_many(self, metric, params, keys):
+        """keys: [(clean_md5, enhanced_md5)] -> [value or None], refreshing the hits' last use"""
+        values = []
+        for clean, enhanced in keys:
+            row = self.db.execute('SELECT value FROM results WHERE metric = ? AND params = ? AND clean = ? AND enhanced = ?',
+                                  (metric, params, clean, enhanced)).fetchone()
+            values.append(None if row is None else json.loads(row[0]))
+        now = time.time()
+        self.db.executemany('UPDATE results SET last_used = ? WHERE metric = ? AND params = ? AND clean = ? AND enhanced = ?',
+                            [(now, metric, params, clean, enhanced) for (clean, enhanced), v in zip(keys, values) if v is not None])
+        self.db.commit()
+        return values
+
+    def put_many(self, metric, params, items):
+        """items: [((clean_md5, enhanced_md5), value)]"""
+        now = time.time()
+        rows = []
+        for (clean, enhanced), value in items:
+            value = json.dumps(value)
+            size = len(metric) + len(params) + len(clean) + len(enhanced) + len(value) + 16
+            rows.append((metric, params, clean, enhanced, value, size, now))
+        self.db.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+        self.db.commit()
+
+    def total_bytes(self):
+        results = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+        hashes = self.db.execute('SELECT COALESCE(SUM(LENGTH(path) + 48), 0) FROM hashes').fetchone()[0]
+        return results + hashes
+
+    def evict(self):
+        """drop least recently used results until the rows fit in max_mb, then the hashes no result refers to"""
+        if self.max_bytes is None:
+            return 0
+        excess = self.total_bytes() - self.max_bytes
+        doomed = []
+        if excess > 0:
+            for rowid, size in self.db.execute('SELECT rowid, size FROM results ORDER BY last_used'):
+                doomed.append((rowid,))
+                excess -= size
+                if excess <= 0:
+                    break
+            self.db.executemany('DELETE FROM results WHERE rowid = ?', doomed)
+        self.db.execute('DELETE FROM hashes WHERE md5 NOT IN (SELECT clean FROM results UNION SELECT enhanced FROM results)')
+        self.db.commit()
+        return len(doomed)
+
+    def clear(self):
+        self.db.execute('DELETE FROM results')
+        self.db.execute('DELETE FROM hashes')
+        self.db.commit()
+
+
+def pool_map(fn, items, jobs=1, chunk_size=None, desc=None):
+    """yields fn(item) of each item in order as they complete, in jobs worker processes (1: in this one)"""
+    if jobs > 1:
+        # a few chunks per worker: little IPC per item, and the pool stays balanced
+        chunk_size = chunk_size or max(1, math.ceil(len(items) / (jobs * 4)))
+        with ProcessPoolExecutor(jobs) as executor:
+            yield from tqdm(executor.map(fn, items, chunksize=chunk_size), total=len(items), desc=desc)
+    else:
+        for item in tqdm(items, desc=desc):
+            yield fn(item)
+
+
+def cached_map(cache, metric, params, pairs, compute, store_every=256):
+    """
+    pairs: [(clean_path or None, enhanced_path)], compute: pairs -> iterable of (value, error) in order.
+    Yields (value, error) for all pairs in order as they complete, calling compute only on the pairs
+    missing from the cache; values computed without error are stored. cache=None computes everything.
+    """
+    if cache is None:
+        yield from compute(pairs)
+        return
+    keys = [(cache.file_hash(clean), cache.file_hash(enhanced)) for clean, enhanced in pairs]
+    hits = cache.get_many(metric, params, keys)
+    todo = [i for i, value in enumerate(hits) if value is None]
+    if len(todo) < len(pairs):
+        print(f"{metric}: {len(pairs) - len(todo)} of {len(pairs)} results from the cache")
+    computed = iter(compute([pairs[i] for i in todo]) if todo else [])
+    new = []
+    try:
+        for i, (key, hit) in enumerate(zip(keys, hits)):
+            if hit is not None:
+                yield hit, None
+                continue
+            value, error = next(computed)
+            if not error:
+                new.append((key, value))
+            # stored before the last computed result is handed out: zip(pairs, results) never resumes us after it
+            if len(new) >= store_every or i == todo[-1]:
+                cache.put_many(metric, params, new)
+                new = []
+            yield value, error
+    finally:
+        if new:
+            cache.put_many(metric, params, new)
+
+
+def check(path):
+    """two runs over the wav folder pairs, read with zip() as the tools do: the second must compute nothing"""
+    from manifest import list_pairs
+    pairs = list_pairs('wav/clean', 'wav/noisy')
+    computed = []
+    def compute(todo):
+        computed.extend(todo)
+        return ((os.path.getsize(enhanced), None) for _, enhanced in todo)
+    with MetricCache(path, max_mb=None) as cache:
+        cache.db.execute("DELETE FROM results WHERE metric = 'check'")
+        cache.db.commit()
+    for _ in range(2):
+        computed.clear()
+        with MetricCache(path, max_mb=None) as cache:
+            values = [value for _, (value, _) in zip(pairs, cached_map(cache, 'check', '', pairs, compute))]
+    assert not computed and values == [os.path.getsize(e) for _, e in pairs], f"{len(computed)} of {len(pairs)} recomputed"
+    print(f"check: second run served all {len(pairs)} results from the cache")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise or clear a metric result cache.")
+    parser.add_argument('cache', type=str, help="Path to the SQLite cache file")
+    parser.add_argument('--clear', action='store_true', help="Delete all cached results and file hashes")
+    parser.add_argument('--check', action='store_true', help="Check on wav/clean and wav/noisy that a second run is served from the cache")
+    args = parser.parse_args()
+
+    if args.check:
+        check(args.cache)
+        return
+    with MetricCache(args.cache, max_mb=None) as cache:
+        if args.clear:
+            cache.clear()
+        for metric, params, count in cache.db.execute('SELECT metric, params, COUNT(*) FROM results GROUP BY metric, params'):
+            print(f"{metric} [{params}]: {count} results")
+        print(f"Total: {cache.total_bytes() / 2 ** 20:.2f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import torch
+from torch.profiler import profile, record_function, ProfilerActivity
+from gtcrn import GTCRN, SFE, ConvBlock, GTConvBlock, TRA, DPGRNN, Mask
+from gtcrn_ckpt import load_gtcrn_weights
+
+'''
+Per-layer wall time / allocated bytes and end-to-end RTF of GTCRN, as JSON:
+python profile_gtcrn.py
+python profile_gtcrn.py --ckpt_path gtcrn_checkpoints/model_trained_on_dns3.tar --frames 63 250 --batch_sizes 1 8 --num_threads 1 4 --fuse -o profile.json
+'''
+
+PROFILED_TYPES = (SFE, ConvBlock, GTConvBlock, TRA, DPGRNN, Mask)
+
+
+class LayerProfiler:
+    """
+    Forward hooks on every SFE/ConvBlock/GTConvBlock/TRA/DPGRNN/Mask, plus ERB.bm/bs
+    (methods, not modules). Nested layers (TRA and SFE inside a GTConvBlock) are
+    also counted in their parent, so the shares do not sum to 1.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.times = {}
+        self._starts = {}
+        self._ranges = {}
+        self.record_ranges = False
+        self.handles = []
+        for name, module in model.named_modules():
+            if isinstance(module, PROFILED_TYPES):
+                self.handles.append(module.register_forward_pre_hook(self._pre_hook(name)))
+                self.handles.append(module.register_forward_hook(self._post_hook(name)))
+        for method in ['bm', 'bs']:
+            setattr(model.erb, method, self._wrap(f'erb.{method}', getattr(model.erb, method)))
+        self.names = [name for name, m in model.named_modules() if isinstance(m, PROFILED_TYPES)] + ['erb.bm', 'erb.bs']
+
+    def _enter(self, name):
+        if self.record_ranges:
+            self._ranges[name] = record_function(name)
+            self._ranges[name].__enter__()
+        self._starts[name] = time.perf_counter()
+
+    def _exit(self, name):
+        self.times.setdefault(name, []).append(time.perf_counter() - self._starts.pop(name))
+        if self.record_ranges:
+            self._ranges.pop(name).__exit__(None, None, None)
+
+    def _pre_hook(self, name):
+        return lambda module, input: self._enter(name)
+
+    def _post_hook(self, name):
+        return lambda module, input, output: self._exit(name)
+
+    def _wrap(self, name, fn):
+        def wrapped(*args, **kwargs):
+            self._enter(name)
+            out = fn(*args, **kwargs)
+            self._exit(name)
+            return out
+        return wrapped
+
+    def allocated_bytes(self, spec):
+        """Bytes allocated by the ops inside each layer for one forward, from torch.profiler"""
+        self.times = {}
+        self.record_ranges = True
+        with torch.no_grad(), profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+            self.model(spec)
+        self.record_ranges = False
+
+        def op_bytes(event):
+            own = 0 if event.name in self.names else max(event.self_cpu_memory_usage, 0)
+            return own + sum(op_bytes(child) for child in event.cpu_children)
+
+        allocated = {}
+        for event in prof.events():
+            if event.name in self.names:
+                allocated[event.name] = allocated.get(event.name, 0) + op_bytes(event)
+        return allocated
+
+    def remove(self):
+        for handle in self.handles:
+            handle.remove()
+        del self.model.erb.bm, self.model.erb.bs
+
+
+def profile_config(model, profiler, frames, batch_size, repeats, warmup):
+    hop, n_fft = 256, 512
+    window = torch.hann_window(n_fft).pow(0.5)
+    mix = torch.randn(batch_size, hop * (frames - 1)) * 0.1
+    spec = torch.view_as_real(torch.stft(mix, n_fft, hop, n_fft, window, return_complex=True))
+
+    with torch.no_grad():
+        for _ in range(warmup):
+            model(spec)
+        profiler.times = {}
+        model_times, e2e_times = [], []
+        for _ in range(repeats):
+            tic = time.perf_counter()
+            spec = torch.view_as_real(torch.stft(mix, n_fft, hop, n_fft, window, return_complex=True))
+            tic_model = time.perf_counter()
+            output = model(spec)
+            model_times.append(time.perf_counter() - tic_model)
+            torch.istft(torch.view_as_complex(output.contiguous()), n_fft, hop, n_fft, window)
+            e2e_times.append(time.perf_counter() - tic)
+    layer_times = profiler.times
+    allocated = profiler.allocated_bytes(spec)
+
+    model_mean = float(np.mean(model_times))
+    layers = {}
+    for name in profiler.names:
+        # a layer called n times per forward (none today) is summed per forward
+        t = np.array(layer_times.get(name, [0.])).reshape(repeats, -1).sum(1)
+        layers[name] = {
+            'mean_ms': float(t.mean() * 1e3),
+            'p95_ms': float(np.percentile(t, 95) * 1e3),
+            'allocated_bytes': int(allocated.get(name, 0)),
+            'share': float(t.mean() / model_mean),
+        }
+    duration = batch_size * mix.shape[1] / 16000
+    return {
+        'frames': frames,
+        'batch_size': batch_size,
+        'model_mean_ms': model_mean * 1e3,
+        'model_p95_ms': float(np.percentile(model_times, 95) * 1e3),
+        'e2e_mean_ms': float(np.mean(e2e_times) * 1e3),
+        'rtf': float(np.mean(e2e_times) / duration),
+        'layers': layers,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-layer latency and RTF profiler for GTCRN (JSON output)")
+    parser.add_argument("--ckpt_path", type=str, default=None, help="Path to the checkpoint file (optional, random weights otherwise)")
+    parser.add_argument("--frames", type=int, nargs='+', default=[63, 250, 1000], help="Input lengths in STFT frames")
+    parser.add_argument("--batch_sizes", type=int, nargs='+', default=[1], help="Batch sizes")
+    parser.add_argument("--num_threads", type=int, nargs='+', default=[1], help="torch intra-op thread counts")
+    parser.add_argument("--repeats", type=int, default=20, help="Timed forwards per configuration")
+    parser.add_argument("--warmup", type=int, default=3, help="Untimed forwards per configuration")
+    parser.add_argument("--fuse", action='store_true', help="Profile the model after GTCRN.fuse_for_inference")
+    parser.add_argument('--output', '-o', type=str, default=None, help="JSON file to write (default: stdout)")
+    args = parser.parse_args()
+
+    model = GTCRN().eval()
+    if args.ckpt_path:
+        load_gtcrn_weights(model, args.ckpt_path)
+    if args.fuse:
+        model.fuse_for_inference()
+    profiler = LayerProfiler(model)
+
+    results = []
+    for num_threads in args.num_threads:
+        torch.set_num_threads(num_threads)
+        for batch_size in args.batch_sizes:
+            for frames in args.frames:
+                result = profile_config(model, profiler, frames, batch_size, args.repeats, args.warmup)
+                results.append({'num_threads': num_threads, **result})
+                print(f"threads={num_threads} batch={batch_size} frames={frames}: "
+                      f"model {result['model_mean_ms']:.2f} ms, RTF {result['rtf']:.4f}", file=sys.stderr)
+    profiler.remove()
+
+    report = {
+        'torch_version': torch.__version__,
+        'checkpoint': args.ckpt_path,
+        'fused': args.fuse,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Profile saved to: {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import functools
+from math import gcd
+import numpy as np
+
+'''
+In-memory polyphase resampling, the anti-aliasing filter designed once per rate pair:
+from resampler import resample
+mix_16k = resample(mix, 48000, 16000)
+
+scipy.signal (about 0.7 s to import) is only loaded once a rate actually differs, check that the
+inference tools do not pull it in at startup:
+python resampler.py
+'''
+
+
+@functools.lru_cache(maxsize=None)
+def resample_filter(orig_sr, target_sr, dtype='float32'):
+    """Kaiser-windowed lowpass of scipy.signal.resample_poly for orig_sr -> target_sr (read-only, shared)"""
+    from scipy.signal import firwin
+    g = gcd(orig_sr, target_sr)
+    max_rate = max(orig_sr // g, target_sr // g)
+    h = firwin(2 * 10 * max_rate + 1, 1. / max_rate, window=('kaiser', 5.0)).astype(dtype)
+    h.flags.writeable = False
+    return h
+
+
+def resample(x, orig_sr, target_sr, axis=0):
+    """x: np.ndarray at orig_sr -> same dtype (float32 stays float32) at target_sr, len ceil(L*target_sr/orig_sr)"""
+    if orig_sr == target_sr:
+        return x
+    from scipy.signal import resample_poly
+    dtype = x.dtype if x.dtype in (np.float32, np.float64) else np.float64
+    g = gcd(orig_sr, target_sr)
+    return resample_poly(x.astype(dtype, copy=False), target_sr // g, orig_sr // g, axis=axis,
+                         window=resample_filter(orig_sr, target_sr, np.dtype(dtype).name))
+
+
+if __name__ == "__main__":
+    import sys
+    import subprocess
+    for module in ['gtcrn_enhancer', 'gtcrn_infer', 'wav_io']:
+        code = f"import sys, {module}; print('scipy.signal' in sys.modules)"
+        loaded = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout.strip()
+        assert loaded == 'False', f"importing {module} loads scipy.signal"
+    x = np.random.default_rng(0).standard_normal(48000).astype(np.float32)
+    y = resample(x, 48000, 16000)
+    assert y.dtype == np.float32 and len(y) == 16000
+    print("scipy.signal not loaded by gtcrn_enhancer, gtcrn_infer, wav_io; resample ok")
@@ -0,0 +1,116 @@
+import os
+import csv
+import json
+import math
+
+'''
+Per-file results appended to a JSONL (or .csv) file as they complete, fsynced periodically,
+with the averages kept by a streaming aggregator. After a crash, --resume picks up where it stopped:
+python calculate_PESQ.py -c wav/clean -e wav/gtcrn_enh -o pesq.jsonl
+python calculate_PESQ.py -c wav/clean -e wav/gtcrn_enh -o pesq.jsonl --resume
+
+from result_log import ResultLog
+with ResultLog('pesq.jsonl', ['file', 'pesq'], resume=True) as log:
+    todo = [pair for pair in pairs if os.path.basename(pair[0]) not in log.done]
+    for ...:
+        log.write({'file': name, 'pesq': score})
+    print(log.stats.mean('pesq'))
+'''
+
+
+class RunningMean:
+    """count, sum and failures (None/NaN) of each numeric field, constant memory"""
+    def __init__(self):
+        self.total, self.count, self.failed = {}, {}, {}
+
+    def add(self, record, skip=()):
+        for key, value in record.items():
+            if key in skip or isinstance(value, bool) or not isinstance(value, (int, float, type(None))):
+                continue
+            if value is None or math.isnan(value):
+                self.failed[key] = self.failed.get(key, 0) + 1
+            else:
+                self.total[key] = self.total.get(key, 0) + value
+                self.count[key] = self.count.get(key, 0) + 1
+
+    def mean(self, key):
+        return self.total[key] / self.count[key] if self.count.get(key) else None
+
+
+class ResultLog:
+    """
+    path: .csv for CSV rows (fieldnames as the header), anything else for JSON lines; None keeps only the averages.
+    resume=True keeps the records already in path (a torn last line is dropped), their key field
+    goes to .done and their values to .stats; resume=False starts the file afresh. Records written
+    in this run only go to .stats and .count, so memory stays constant however long the run.
+    """
+    def __init__(self, path, fieldnames, resume=False, key='file', fsync_every=100):
+        self.path, self.fieldnames, self.key, self.fsync_every = path, list(fieldnames), key, fsync_every
+        self.done = set()
+        self.count = 0
+        self.stats = RunningMean()
+        self.csv = path is not None and path.endswith('.csv')
+        self.file, self.writer, self.unsynced = None, None, 0
+        if path is None:
+            return
+        if resume and os.path.exists(path):
+            for record in self.read(path):
+                self.done.add(record[self.key])
+                self.add(record)
+        else:
+            open(path, 'w').close()
+        self.file = open(path, 'a', newline='')
+        if self.csv:
+            self.writer = csv.DictWriter(self.file, fieldnames=self.fieldnames, extrasaction='ignore')
+            if self.file.tell() == 0:
+                self.writer.writeheader()
+
+    def read(self, path):
+        """records of a previous run, truncating path after the last complete line"""
+        with open(path, 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b'\n') + 1
+            if end < len(data):
+                f.truncate(end)
+        lines = data[:end].decode().splitlines()
+        if self.csv:
+            for row in csv.DictReader(lines):
+                yield {k: v if k == self.key else float(v) if v not in ('', 'None') else None for k, v in row.items()}
+        else:
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+
+    def add(self, record):
+        self.count += 1
+        self.stats.add(record, skip=(self.key,))
+
+    def write(self, record):
+        self.add(record)
+        if self.file is None:
+            return
+        if self.csv:
+            self.writer.writerow(record)
+        else:
+            self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+        self.unsynced += 1
+        if self.unsynced >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        if self.file is not None and self.unsynced:
+            os.fsync(self.file.fileno())
+            self.unsynced = 0
+
+    def close(self):
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -3,6 +3,7 @@ import argparse
 import librosa
 import soundfile as sf
 from tqdm import tqdm
+from wav_io import read_audio
 
 '''
 python trim_silence.py -i wav/noisy --threshold_db 30
@@ -17,7 +18,7 @@ def trim_silence(input_dir, threshold_db):
     for filename in tqdm(os.listdir(input_dir), desc="trimming"):
         if filename.endswith(".wav"):
             file_path = os.path.join(input_dir, filename)
-            y, fs = librosa.load(file_path, sr=None)
+            y, fs = read_audio(file_path, mono=True)
             yt, _ = librosa.effects.trim(y, top_db=threshold_db)
             output_path = os.path.join(output_dir, filename)
             sf.write(output_path, yt, fs)
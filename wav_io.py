@@ -0,0 +1,144 @@
+import os
+import struct
+from collections import namedtuple
+import numpy as np
+
+'''
+Zero-copy WAV loading shared by the tools: PCM/float WAV data memory-mapped as read-only views in the
+stored dtype, converted to float only when a consumer asks for it, resampled only on demand.
+from wav_io import load_wav, as_float, read_audio
+data, fs = load_wav('wav/clean/p232_001.wav')             # int16 view, no decode, no copy
+x = as_float(data)                                        # float32 in [-1, 1), the one copy
+x, fs = read_audio('wav/clean/p232_001.wav', sr=48000, mono=True)
+
+parity with soundfile on the wav folder:
+python wav_io.py
+'''
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+WavLayout = namedtuple('WavLayout', ['sr', 'channels', 'format_tag', 'bits', 'offset', 'frames'])
+
+
+def wav_layout(path, file_size=None):
+    """WavLayout (offset: byte position of the samples) from a RIFF/WAVE header, None if the file is not one"""
+    file_size = os.path.getsize(path) if file_size is None else file_size
+    with open(path, 'rb') as f:
+        head = f.read(12)
+        if len(head) < 12 or head[:4] != b'RIFF' or head[8:12] != b'WAVE':
+            return None
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return None
+            chunk_id, size = chunk[:4], struct.unpack('<I', chunk[4:])[0]
+            if chunk_id == b'fmt ':
+                fmt = f.read(size + (size & 1))
+            elif chunk_id == b'data':
+                if fmt is None or len(fmt) < 16:
+                    return None
+                format_tag, channels, sr = struct.unpack('<HHI', fmt[:8])
+                block_align, bits = struct.unpack('<HH', fmt[12:16])
+                if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+                    format_tag = struct.unpack('<H', fmt[24:26])[0]  # first two bytes of the sub-format GUID
+                offset = f.tell()
+                # streamed writers may leave the data size at 0 or 0xFFFFFFFF: trust the file size then
+                size = file_size - offset if size in (0, 0xFFFFFFFF) else min(size, file_size - offset)
+                return WavLayout(sr, channels, format_tag, bits, offset, size // max(block_align, 1))
+            else:
+                f.seek(size + (size & 1), 1)
+
+
+def native_dtype(layout):
+    """numpy dtype the samples can be viewed as, None for layouts that need decoding (e.g. 24-bit PCM)"""
+    if layout.format_tag == WAVE_FORMAT_PCM:
+        return {8: np.dtype('u1'), 16: np.dtype('<i2'), 32: np.dtype('<i4')}.get(layout.bits)
+    if layout.format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        return {32: np.dtype('<f4'), 64: np.dtype('<f8')}.get(layout.bits)
+    return None
+
+
+def load_wav(path):
+    """
+    path -> (data, sr): read-only memory-mapped view of the samples in their stored dtype, (frames,) for
+    mono and (frames, channels) otherwise. What cannot be viewed (24-bit PCM, other containers) is decoded
+    by soundfile, PCM to int32 and the rest to float32, and returned read-only as well.
+    """
+    layout = wav_layout(path)
+    dtype = native_dtype(layout) if layout is not None else None
+    if dtype is None:
+        import soundfile as sf
+        dtype = 'int32' if 'PCM' in sf.info(path).subtype else 'float32'
+        data, sr = sf.read(path, dtype=dtype)
+    elif layout.frames == 0:
+        data, sr = np.zeros((0, layout.channels), dtype), layout.sr
+    else:
+        data = np.memmap(path, dtype, mode='r', offset=layout.offset, shape=(layout.frames, layout.channels)).view(np.ndarray)
+        sr = layout.sr
+    if data.ndim == 2 and data.shape[1] == 1:
+        data = data[:, 0]
+    data.flags.writeable = False
+    return data, sr
+
+
+def as_float(data, dtype=np.float32):
+    """
+    samples -> dtype in [-1, 1): integers scaled by their full scale (as soundfile does), float data
+    already in dtype returned as it is, without a copy
+    """
+    data = np.asarray(data)
+    if data.dtype.kind == 'f':
+        return data.astype(dtype, copy=False)
+    x = data.astype(dtype)
+    if data.dtype.kind == 'u':
+        x -= 2 ** (8 * data.dtype.itemsize - 1)
+    x *= dtype(2. ** (1 - 8 * data.dtype.itemsize))
+    return x
+
+
+def read_audio(path, sr=None, dtype=np.float32, mono=False):
+    """path -> (samples in dtype, sr): load_wav + as_float, channels averaged if mono, resampled if sr differs"""
+    data, fs = load_wav(path)
+    x = as_float(data, dtype)
+    if mono and x.ndim == 2:
+        x = x.mean(axis=1, dtype=dtype)
+    if sr is not None and sr != fs:
+        from resampler import resample
+        x, fs = resample(x, fs, sr), sr
+    return x, fs
+
+
+if __name__ == "__main__":
+    import time
+    import tempfile
+    import soundfile as sf
+    from manifest import list_files
+
+    paths = list_files('wav/clean') + list_files('wav/noisy')
+    for dtype in ['PCM_16', 'PCM_24', 'PCM_32', 'PCM_U8', 'FLOAT', 'DOUBLE']:
+        x, fs = sf.read(paths[0], dtype='float64')
+        tmp = os.path.join(tempfile.gettempdir(), f'wav_io_{dtype}.wav')
+        sf.write(tmp, np.stack([x, -x], 1), fs, subtype=dtype)
+        paths.append(tmp)
+    max_err = 0.
+    for path in paths:
+        reference, fs = sf.read(path, dtype='float64')
+        x, sr = read_audio(path, dtype=np.float64)
+        assert sr == fs and x.shape == reference.shape, path
+        max_err = max(max_err, np.abs(x - reference).max(initial=0))
+    print(f"{len(paths)} files, max abs error against soundfile: {max_err:.2e}")
+
+    tic = time.perf_counter()
+    for _ in range(20):
+        for path in paths:
+            sf.read(path)
+    t_sf = time.perf_counter() - tic
+    tic = time.perf_counter()
+    for _ in range(20):
+        for path in paths:
+            load_wav(path)
+    t_view = time.perf_counter() - tic
+    print(f"soundfile float64 decode {t_sf * 1000:.1f} ms, load_wav views {t_view * 1000:.1f} ms")